@@ -0,0 +1,119 @@
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import connection
+from drf_util.utils import gt
+from rest_framework.response import Response
+
+from apps.common.models import CacheGeneration
+from config import settings
+
+STATS_KEY = 'response-cache:{}'
+
+
+def get_generations(models):
+    """
+    The current generation of each model, with one query.
+    """
+    labels = [model._meta.label_lower for model in models]
+    generations = dict(CacheGeneration.objects.filter(label__in=labels).values_list('label', 'value'))
+
+    missing = [label for label in labels if label not in generations]
+    if missing:
+        table = CacheGeneration._meta.db_table
+        with connection.cursor() as cursor:
+            # The no-op update returns the row another process may have created meanwhile
+            cursor.execute(f"""
+                INSERT INTO {table} (label, value) VALUES {', '.join(['(%s, %s)'] * len(missing))}
+                ON CONFLICT (label) DO UPDATE SET value = {table}.value
+                RETURNING label, value
+            """, [value for label in missing for value in (label, time.time_ns())])
+            generations.update(cursor.fetchall())
+
+    return [generations[label] for label in labels]
+
+
+def get_generation(model):
+    return get_generations([model])[0]
+
+
+def get_view_generations(view):
+    # Read once per request, the conditional GET and the response cache both use them
+    if not hasattr(view, '_cache_generations'):
+        view._cache_generations = get_generations(view.cache_models)
+    return view._cache_generations
+
+
+def bump_generation(model):
+    """
+    Invalidate every cached response built from this model. Part of the current transaction, so responses
+    cached before the write commits are not served after it.
+    Generations follow the clock, a rolled back bump is never reused by the next one.
+    """
+    table = CacheGeneration._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {table} (label, value) VALUES (%s, %s)
+            ON CONFLICT (label) DO UPDATE SET value = GREATEST({table}.value + 1, EXCLUDED.value)
+        """, [model._meta.label_lower, time.time_ns()])
+
+
+def bump_generation_receiver(sender, *args, **kwargs):
+    bump_generation(sender)
+
+
+def record_stat(name):
+    key = STATS_KEY.format(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_stats():
+    return {name: cache.get(STATS_KEY.format(name), 0) for name in ('hits', 'misses')}
+
+
+def response_cache_key(request, generations):
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    generations = ':'.join(map(str, generations))
+    raw_key = f'{gt(request.user, "role")}:{request.path}?{query}:{generations}'
+    return 'response:' + hashlib.sha1(raw_key.encode()).hexdigest()
+
+
+def cache_response(view_method):
+    """
+    Cache the data of successful responses until one of the view's `cache_models` changes.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = response_cache_key(request, get_view_generations(self))
+
+        data = cache.get(key)
+        if data is not None:
+            record_stat('hits')
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        record_stat('misses')
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+            response['X-Cache'] = 'MISS'
+        return response
+
+    return wrapper
+
+
+class CachedResponseMixin:
+    cache_models = ()
+
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
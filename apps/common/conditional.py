@@ -0,0 +1,84 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Max, Count
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from drf_util.utils import gt
+
+from apps.common.cache import get_view_generations
+
+
+class ConditionalGetMixin:
+    """
+    Answer unchanged resources with 304 before the response body is built. Lists are versioned by the
+    generations of the view's `cache_models`, read with one primary key query. Single objects get an ETag
+    and a Last-Modified from one aggregate query over `updated_at`.
+    """
+
+    def get_conditional_aggregates(self):
+        """
+        Aggregates that change whenever the response does, `Max` of datetimes also feed Last-Modified.
+        """
+        return {'last_modified': Max('updated_at'), 'count': Count('id', distinct=True)}
+
+    def get_conditional_values(self, request):
+        if self.action == 'list':
+            # The query string is part of the ETag, what is left to version is the data behind it
+            return {f'generation_{model._meta.label_lower}': generation
+                    for model, generation in zip(self.cache_models, get_view_generations(self))}
+
+        aggregates = {f'conditional_{name}': value for name, value in self.get_conditional_aggregates().items()}
+
+        # Related rows nested with `?expand=` are part of the response too
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'get_expanded'):
+            for name in serializer_class.get_expanded(request):
+                aggregates[f'conditional_expanded_{name}'] = Max(f'{name}__updated_at')
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).order_by()
+
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        instance = get_object_or_404(
+            queryset.annotate(**aggregates), **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(request, instance)
+        return {name: getattr(instance, name) for name in aggregates}
+
+
+def conditional_get(view_method):
+    """
+    Answer with 304 when the client copy is current, see ConditionalGetMixin.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        values = self.get_conditional_values(request)
+
+        raw_etag = f'{gt(request.user, "role")}:{request.get_full_path()}:{sorted(values.items())}'
+        etag = quote_etag(hashlib.md5(raw_etag.encode()).hexdigest())
+        dates = [value for value in values.values() if hasattr(value, 'timestamp')]
+        last_modified = int(max(dates).timestamp()) if dates else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    return wrapper
+
+
+class ConditionalListMixin(ConditionalGetMixin):
+    @conditional_get
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+
+class ConditionalRetrieveMixin(ConditionalGetMixin):
+    @conditional_get
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
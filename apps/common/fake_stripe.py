@@ -0,0 +1,126 @@
+import json
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+PAYMENT_INTENT_PATH = re.compile(r'^/v1/payment_intents(?:/(?P<id>[\w]+))?/?$')
+FORM_KEY = re.compile(r'[^\[\]]+')
+
+
+def parse_form(body):
+    """
+    Stripe's form encoding, `metadata[order_id]=1` becomes {'metadata': {'order_id': '1'}}.
+    """
+    data = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        *parents, name = FORM_KEY.findall(key)
+        target = data
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[name] = value
+    return data
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real API
+    protocol_version = 'HTTP/1.1'
+    server: 'FakeStripeServer'
+
+    def handle_one_request(self):
+        self.server.connections.add(self.client_address)
+        super().handle_one_request()
+
+    def do_POST(self):
+        match = PAYMENT_INTENT_PATH.match(self.path)
+        if not match or match['id']:
+            return self.send_json(404, {'error': {'type': 'invalid_request_error', 'message': 'Unknown path.'}})
+
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+        status, intent = self.server.create_payment_intent(parse_form(body), self.headers.get('Idempotency-Key'))
+        self.send_json(status, intent)
+
+    def do_GET(self):
+        match = PAYMENT_INTENT_PATH.match(self.path)
+        intent = self.server.intents.get(match['id']) if match and match['id'] else None
+        if not intent:
+            return self.send_json(404, {'error': {'type': 'invalid_request_error', 'message': 'No such payment_intent.'}})
+        self.send_json(200, intent)
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Request-Id', f'req_{secrets.token_hex(8)}')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeStripeServer(ThreadingHTTPServer):
+    """
+    Enough of the Stripe API to create and read PaymentIntents offline, point `stripe.api_base` at `url`.
+    `fail_next(count)` answers the next requests with a 500, like a Stripe outage.
+    """
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), FakeStripeHandler)
+        self.intents = {}
+        self.idempotency_keys = {}
+        self.requests = 0
+        self.connections = set()
+        self.failures = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def fail_next(self, count=1):
+        with self.lock:
+            self.failures = count
+
+    def create_payment_intent(self, data, idempotency_key=None):
+        with self.lock:
+            self.requests += 1
+            if self.failures:
+                self.failures -= 1
+                return 500, {'error': {'type': 'api_error', 'message': 'Something went wrong on the fake Stripe.'}}
+
+            # A retried request gets the intent of the first one, like Stripe's idempotent requests
+            if idempotency_key in self.idempotency_keys:
+                return 200, self.intents[self.idempotency_keys[idempotency_key]]
+
+            intent_id = f'pi_{secrets.token_hex(12)}'
+            intent = {
+                'id': intent_id,
+                'object': 'payment_intent',
+                'amount': int(data.get('amount', 0)),
+                'currency': data.get('currency', 'usd'),
+                'metadata': data.get('metadata', {}),
+                'status': 'requires_payment_method',
+                'client_secret': f'{intent_id}_secret_{secrets.token_hex(12)}',
+                'created': int(time.time()),
+                'livemode': False,
+            }
+            self.intents[intent_id] = intent
+            if idempotency_key:
+                self.idempotency_keys[idempotency_key] = intent_id
+            return 200, intent
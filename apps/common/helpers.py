@@ -3,9 +3,17 @@ from string import ascii_letters, digits
 from config import settings
 import stripe
 
+from apps.common.stripe_client import StripeHttpClient
 from config.settings import env
 
 stripe.api_key = settings.STRIPE_SECRET_TEST_API_KEY
+stripe.api_base = settings.STRIPE_API_BASE
+stripe.max_network_retries = settings.STRIPE_MAX_NETWORK_RETRIES
+stripe.default_http_client = StripeHttpClient(
+    connect_timeout=settings.STRIPE_CONNECT_TIMEOUT,
+    read_timeout=settings.STRIPE_READ_TIMEOUT,
+    pool_size=settings.STRIPE_POOL_SIZE,
+)
 
 
 def decimal_to_int_stripe(money):
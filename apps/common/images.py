@@ -0,0 +1,93 @@
+import datetime
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+from django.db import connection, transaction
+
+from apps.common.cache import bump_generation
+from config import settings
+
+VARIANTS = {
+    'thumbnail': {'size': (200, 200), 'format': 'JPEG', 'extension': 'jpg'},
+    'medium': {'size': (800, 800), 'format': 'JPEG', 'extension': 'jpg'},
+    'webp': {'size': (1600, 1600), 'format': 'WEBP', 'extension': 'webp'},
+}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_VARIANT_WORKERS)
+    return _executor
+
+
+def variant_name(name, variant):
+    """
+    Storage name of a variant, e.g. product/attachments/photo.thumbnail.jpg
+    """
+    root, _ = os.path.splitext(name)
+    return f'{root}.{variant}.{VARIANTS[variant]["extension"]}'
+
+
+def generate_variants(path):
+    """
+    Write every variant of the image next to it. Runs in the worker processes, so it only touches files.
+    """
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+
+        for variant, spec in VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail(spec['size'])
+            if spec['format'] == 'JPEG' and resized.mode not in ('RGB', 'L'):
+                resized = resized.convert('RGB')
+
+            target = variant_name(path, variant)
+            temporary = f'{target}.part'
+            resized.save(temporary, spec['format'], quality=85)
+            os.replace(temporary, target)
+
+
+def enqueue_variants(field_file):
+    """
+    Generate the variants of an uploaded image in the process pool once the upload is committed.
+    """
+    instance = field_file.instance
+    field = field_file.field.name
+    if not field_file or getattr(instance, f'{field}_variants') == field_file.name:
+        return
+
+    path = field_file.path
+    model = type(instance)
+    pk = instance.pk
+    name = field_file.name
+
+    def submit():
+        future = get_executor().submit(generate_variants, path)
+        future.add_done_callback(lambda done: variants_done(done, model, pk, field, name))
+
+    transaction.on_commit(submit)
+
+
+def variants_done(future, model, pk, field, name):
+    """
+    Record the variants on the row, unless the image was replaced meanwhile. Cached responses and client ETags
+    still point to the missing variants.
+    """
+    if future.exception() is not None:
+        logger.error('Generating the variants of %s failed', name, exc_info=future.exception())
+        return
+
+    try:
+        model._default_manager.filter(pk=pk, **{field: name}).update(
+            **{f'{field}_variants': name}, updated_at=datetime.datetime.now())
+        bump_generation(model)
+    finally:
+        # Runs in the executor's callback thread, which Django does not clean up after
+        connection.close()
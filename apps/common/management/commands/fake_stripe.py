@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.common.fake_stripe import FakeStripeServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the Stripe API, use it with STRIPE_API_BASE=http://127.0.0.1:<port>.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=12111)
+
+    def handle(self, *args, **options):
+        server = FakeStripeServer(port=options['port'])
+        self.stdout.write(f'Fake Stripe listening on {server.url}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
@@ -10,3 +10,11 @@ class BaseModel(models.Model):
     class Meta:
         abstract = True
 
+
+class CacheGeneration(models.Model):
+    """
+    Version of the cached responses built from a model, see apps.common.cache. Kept in the database so that
+    writes from management commands and other processes invalidate the responses of every web process.
+    """
+    label = models.CharField(max_length=100, primary_key=True)
+    value = models.BigIntegerField()
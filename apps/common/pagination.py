@@ -0,0 +1,134 @@
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError, NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination, Cursor
+
+
+def keyset_filter(ordering, values):
+    """
+    Rows after `values` in `ordering`, e.g. `price > 5 OR (price = 5 AND id > 12)` for ('price', 'id'). The bound on
+    the first field keeps it a range scan of the (field, id) index.
+    """
+    condition = None
+    for field, value in reversed(list(zip(ordering, values))):
+        name = field.lstrip('-')
+        after = Q(**{f'{name}__{"lt" if field.startswith("-") else "gt"}': value})
+        condition = after if condition is None else after | (Q(**{name: value}) & condition)
+
+    field, value = ordering[0], values[0]
+    return Q(**{f'{field.lstrip("-")}__{"lte" if field.startswith("-") else "gte"}': value}) & condition
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset pages in the order the view gave the queryset, e.g. from `?ordering=`, newest first by default.
+    The cursor holds the values of every ordering field of the row it stopped at, the id included, so ties
+    never turn into offsets.
+    """
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(queryset.query.order_by)
+        if not ordering:
+            return super().get_ordering(request, queryset, view)
+
+        if not all(isinstance(field, str) and '__' not in field for field in ordering):
+            raise ValidationError({'paginator': 'This ordering can not be paginated with a cursor.'})
+
+        # The id breaks the ties, so that every row has one place in the order, in the direction of the first field
+        # so that the (field, id) indexes serve it
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering += ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+        values = self.decode_position(self.cursor.position) if self.cursor else None
+
+        # Previous pages are read backwards from the first row of the current one
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(keyset_filter(ordering, values))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+
+        self.has_next = has_more if not reverse else values is not None
+        self.has_previous = values is not None if not reverse else has_more
+        return self.page
+
+    def get_position(self, instance):
+        return json.dumps([str(getattr(instance, field.lstrip('-'))) for field in self.ordering])
+
+    def decode_position(self, position):
+        try:
+            values = json.loads(position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.get_position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.get_position(self.page[0])))
+
+
+class OptionalCursorPagination(BasePagination):
+    """
+    Page number pagination by default, keyset pagination on `list` when the client asks for it
+    with `?paginator=cursor`. The following pages are requested with the returned `next` link.
+    """
+    mode_query_param = 'paginator'
+    cursor_actions = ('list',)
+
+    def __init__(self):
+        self.paginator = PageNumberPagination()
+
+    def use_cursor(self, request, view):
+        return (request.query_params.get(self.mode_query_param) == 'cursor'
+                and getattr(view, 'action', None) in self.cursor_actions)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request, view):
+            self.paginator = KeysetPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.paginator.get_paginated_response_schema(schema)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_results(self, data):
+        return self.paginator.get_results(data)
+
+    def get_schema_fields(self, view):
+        return self.paginator.get_schema_fields(view)
+
+    def get_schema_operation_parameters(self, view):
+        return self.paginator.get_schema_operation_parameters(view)
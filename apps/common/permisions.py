@@ -10,7 +10,7 @@ class IsAdmin(BasePermission):
 
 class IsAdminOrOwner(BasePermission):
     def has_object_permission(self, request, view, obj):
-        return (request.user.role == User.Role.ADMIN) | (obj.user == request.user)
+        return (request.user.role == User.Role.ADMIN) | (obj.user_id == request.user.id)
 
 
 class IsAdminOrItself(BasePermission):
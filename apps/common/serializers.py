@@ -0,0 +1,91 @@
+from django.core.files.storage import default_storage
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+
+from apps.common.images import VARIANTS, variant_name
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    URLs of the resized variants of an image field, null until they are generated. The model records that next
+    to the image, in `<image field>_variants`, so no storage lookups are needed.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+
+        request = self.context.get('request')
+        generated = getattr(value.instance, f'{value.field.name}_variants') == value.name
+        variants = {}
+        for variant in VARIANTS:
+            url = default_storage.url(variant_name(value.name, variant)) if generated else None
+            variants[variant] = request.build_absolute_uri(url) if url and request else url
+        return variants
+
+
+class SparseFieldsMixin:
+    """
+    Lets GET requests pick the fields with `?fields=id,name` and turn related ids into objects with `?expand=category`.
+
+    `Meta.expandable_fields` maps field names to the dotted path of their serializer and `Meta.prefetch_fields`
+    maps nested and method fields to the lookups they need, `sparse_queryset` uses both so that omitted fields are
+    not queried either.
+    """
+
+    @staticmethod
+    def get_requested(request, param):
+        value = request.query_params.get(param) if request and request.method == 'GET' else None
+        if value is None:
+            return None
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+    @classmethod
+    def get_expanded(cls, request):
+        expandable = getattr(cls.Meta, 'expandable_fields', {})
+        return {name: import_string(expandable[name]) for name in cls.get_requested(request, 'expand') or ()
+                if name in expandable}
+
+    @classmethod
+    def sparse_queryset(cls, queryset, request, required_fields=()):
+        """
+        `required_fields` are loaded even when not requested, e.g. the owner an object permission checks.
+        """
+        requested = cls.get_requested(request, 'fields')
+        expanded = cls.get_expanded(request)
+
+        if requested is not None:
+            prefetch_fields = getattr(cls.Meta, 'prefetch_fields', {})
+            lookups = [lookup for name, lookups in prefetch_fields.items() if name in requested for lookup in lookups]
+            concrete = {field.name for field in queryset.model._meta.concrete_fields}
+            queryset = (queryset.select_related(None).prefetch_related(None).prefetch_related(*lookups)
+                        .only(queryset.model._meta.pk.name, *required_fields, *(requested & concrete)))
+
+        for name, serializer_class in expanded.items():
+            if requested is None or name in requested:
+                nested_lookups = getattr(serializer_class.Meta, 'prefetch_fields', {}).values()
+                queryset = queryset.select_related(name).prefetch_related(
+                    *(f'{name}__{lookup}' for lookups in nested_lookups for lookup in lookups))
+
+        return queryset
+
+    def get_fields(self):
+        fields = super().get_fields()
+
+        # Nested serializers render in full, the query parameters apply to the top level only
+        parent = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        if parent is not None:
+            return fields
+
+        request = self.context.get('request')
+        for name, serializer_class in self.get_expanded(request).items():
+            fields[name] = serializer_class(read_only=True)
+
+        requested = self.get_requested(request, 'fields')
+        if requested is not None:
+            fields = type(fields)((name, field) for name, field in fields.items() if name in requested)
+        return fields
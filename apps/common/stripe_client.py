@@ -0,0 +1,92 @@
+import hashlib
+import re
+import time
+from urllib.parse import urlparse
+
+import requests
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from stripe.http_client import RequestsClient
+
+OPERATIONS_KEY = 'stripe-latency:operations'
+LATENCY_KEY = 'stripe-latency:{}:{}'
+# Upper bounds in milliseconds, the last bucket counts the slower calls
+LATENCY_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000)
+OBJECT_ID = re.compile(r'/[a-z]+_\w*\d\w*')
+
+
+def operation_name(method, url):
+    """
+    The method and path of a Stripe call without object ids, e.g. `GET /v1/payment_intents/{id}`.
+    """
+    path = urlparse(url).path
+    return f'{method.upper()} {OBJECT_ID.sub("/{id}", path)}'
+
+
+def latency_key(operation, field):
+    # Operation names have spaces and braces, which memcached keys may not
+    return LATENCY_KEY.format(hashlib.md5(operation.encode()).hexdigest(), field)
+
+
+def incr(key, delta=1):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, timeout=None)
+
+
+def record_latency(operation, milliseconds, failed):
+    operations = cache.get(OPERATIONS_KEY, [])
+    if operation not in operations:
+        cache.set(OPERATIONS_KEY, sorted({*operations, operation}), timeout=None)
+
+    bucket = next((bound for bound in LATENCY_BUCKETS if milliseconds <= bound), 'slower')
+    incr(latency_key(operation, 'count'))
+    incr(latency_key(operation, 'total_ms'), round(milliseconds))
+    incr(latency_key(operation, f'le_{bucket}'))
+    if failed:
+        incr(latency_key(operation, 'errors'))
+
+
+def get_latency_stats():
+    """
+    Request count, errors, total time and latency histogram of every Stripe operation, retries included.
+    """
+    fields = ['count', 'errors', 'total_ms'] + [f'le_{bucket}' for bucket in LATENCY_BUCKETS + ('slower',)]
+    stats = {}
+    for operation in cache.get(OPERATIONS_KEY, []):
+        values = cache.get_many([latency_key(operation, field) for field in fields])
+        stats[operation] = {field: values.get(latency_key(operation, field), 0) for field in fields}
+    return stats
+
+
+class StripeHttpClient(RequestsClient):
+    """
+    The stock requests client with keep-alive connections from one pool per process, (connect, read) timeouts
+    and a latency record of every attempt. Retries and their jittered backoff stay with the stripe library,
+    bounded by `stripe.max_network_retries`.
+    """
+
+    def __init__(self, connect_timeout, read_timeout, pool_size=10, **kwargs):
+        super().__init__(timeout=(connect_timeout, read_timeout), **kwargs)
+        # Sessions are per thread, the adapter and its connection pool are shared by all of them
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+
+    def new_session(self):
+        session = requests.Session()
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        return session
+
+    def _request_internal(self, method, url, headers, post_data, is_streaming):
+        if getattr(self._thread_local, 'session', None) is None:
+            self._thread_local.session = self.new_session()
+
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = super()._request_internal(method, url, headers, post_data, is_streaming)
+            failed = response[1] >= 500 or response[1] == 429
+            return response
+        finally:
+            record_latency(operation_name(method, url), (time.perf_counter() - started) * 1000, failed)
@@ -1,3 +1,84 @@
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.common.fake_stripe import FakeStripeServer
+from apps.common.helpers import stripe
+from apps.common.stripe_client import StripeHttpClient, operation_name
+from apps.users.models import User
+
+
+class TestStripeClient(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.admin_user = User.objects.create(
+            email='admin@example.com', phone='+23561391790', is_active=True, role='admin')
+
+        self.stripe_server = FakeStripeServer().start()
+        self.addCleanup(self.stripe_server.stop)
+
+        stripe_patch = mock.patch.multiple(
+            stripe, api_base=self.stripe_server.url, api_key='sk_test_fake', max_network_retries=2,
+            default_http_client=StripeHttpClient(connect_timeout=1, read_timeout=5))
+        stripe_patch.start()
+        self.addCleanup(stripe_patch.stop)
+
+    def test_operation_name(self):
+        self.assertEqual(operation_name('get', 'https://api.stripe.com/v1/payment_intents/pi_3NxYz8Ab12'),
+                         'GET /v1/payment_intents/{id}')
+        self.assertEqual(operation_name('post', 'https://api.stripe.com/v1/payment_intents'),
+                         'POST /v1/payment_intents')
+
+    def test_connections_are_reused(self):
+        intent = stripe.PaymentIntent.create(amount=100, currency='mdl')
+        stripe.PaymentIntent.retrieve(intent.id)
+        stripe.PaymentIntent.create(amount=200, currency='mdl')
+
+        self.assertEqual(self.stripe_server.requests, 2)
+        self.assertEqual(len(self.stripe_server.connections), 1)
+
+    def test_server_errors_are_retried(self):
+        self.stripe_server.fail_next()
+
+        with mock.patch('time.sleep') as sleep:
+            intent = stripe.PaymentIntent.create(amount=100, currency='mdl')
+
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(self.stripe_server.requests, 2)
+        # Retries are sent with the idempotency key of the first attempt
+        self.assertEqual(list(self.stripe_server.intents), [intent.id])
+
+    def test_retries_are_bounded(self):
+        self.stripe_server.fail_next(5)
+
+        with mock.patch('time.sleep'), self.assertRaises(stripe.error.APIError):
+            stripe.PaymentIntent.create(amount=100, currency='mdl')
+
+        self.assertEqual(self.stripe_server.requests, 3)
+
+    def test_admin_get_stripe_stats(self):
+        self.client.force_authenticate(self.admin_user)
+        self.stripe_server.fail_next()
+
+        with mock.patch('time.sleep'):
+            stripe.PaymentIntent.create(amount=100, currency='mdl')
+
+        response = self.client.get(reverse('stripe-stats'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stats = response.data['POST /v1/payment_intents']
+        self.assertEqual((stats['count'], stats['errors']), (2, 1))
+        self.assertEqual(sum(value for field, value in stats.items() if field.startswith('le_')), 2)
+
+    def test_user_get_stripe_stats_negative(self):
+        self.client.force_authenticate(User.objects.create(email='user@example.com', is_active=True))
+
+        response = self.client.get(reverse('stripe-stats'))
 
-# Create your tests here.
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
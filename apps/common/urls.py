@@ -1,8 +1,10 @@
 from django.urls import path
 
-from apps.common.views import StripeWebhookView
+from apps.common.views import StripeWebhookView, CacheStatsView, StripeStatsView
 
 urlpatterns = [
-    path('webhooks/stripe', StripeWebhookView.as_view(), name='webhooks-stripe')
+    path('webhooks/stripe', StripeWebhookView.as_view(), name='webhooks-stripe'),
+    path('cache/stats', CacheStatsView.as_view(), name='cache-stats'),
+    path('stripe/stats', StripeStatsView.as_view(), name='stripe-stats'),
 ]
 
@@ -1,6 +1,8 @@
+import datetime
 from json import loads
+from django.db import transaction
 from drf_util.utils import gt
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
@@ -9,7 +11,10 @@ from rest_framework import status
 from apps.logs.models import Log
 from apps.orders.models import Order, Invoice, Cart
 
+from apps.common.cache import get_stats
 from apps.common.helpers import stripe
+from apps.common.permisions import IsAdmin
+from apps.common.stripe_client import get_latency_stats
 from config import settings
 
 status_mapping = {
@@ -36,19 +41,47 @@ class StripeWebhookView(APIView):
             order_id = gt(event, 'data.object.metadata.order_id')
             user_id = gt(event, 'data.object.metadata.user_id')
 
-            Order.objects.filter(id=order_id).update(status=order_status)
+            # Stripe may deliver the same event more than once, count the sales only on the first one.
+            # All of it commits together, so a failure leaves the event to be counted on Stripe's retry.
+            with transaction.atomic():
+                now = datetime.datetime.now()
+                changed = Order.objects.filter(id=order_id).exclude(status=order_status).update(
+                    status=order_status, updated_at=now)
 
-            if order_status == Order.Status.CONFIRMED:
-                Cart.objects.filter(user_id=user_id, is_archived=False).update(is_archived=True)
+                if order_status == Order.Status.CONFIRMED:
+                    Cart.objects.filter(user_id=user_id, is_archived=False).update(is_archived=True, updated_at=now)
 
-                Invoice.objects.filter(order_id=order_id).update(status=Invoice.Status.SUCCEEDED)
+                    Invoice.objects.filter(order_id=order_id).update(status=Invoice.Status.SUCCEEDED, updated_at=now)
 
-            elif order_status == Order.Status.CANCELED:
-                Invoice.objects.filter(order_id=order_id).update(status=Invoice.Status.CANCELED)
+                    if changed:
+                        Order.objects.get(id=order_id).record_sales()
+
+                elif order_status == Order.Status.CANCELED:
+                    Invoice.objects.filter(order_id=order_id).update(status=Invoice.Status.CANCELED, updated_at=now)
 
         return Response(status=status.HTTP_200_OK)
 
 
+class CacheStatsView(APIView):
+    """
+    Hit and miss counters of the response cache.
+    """
+    permission_classes = (IsAuthenticated, IsAdmin)
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_stats())
+
+
+class StripeStatsView(APIView):
+    """
+    Latency of the Stripe API calls, per operation.
+    """
+    permission_classes = (IsAuthenticated, IsAdmin)
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_latency_stats())
+
+
 def get_event_from_request(request):
     payload = request.body
     sig_header = request.headers.get('STRIPE_SIGNATURE')
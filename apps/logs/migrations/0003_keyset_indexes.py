@@ -0,0 +1,21 @@
+# Generated by Django 3.2.22 on 2026-10-18 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0002_auto_20231103_1721'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='log',
+            options={'ordering': ['-id']},
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['event_type', 'id'], name='logs_log_event_t_e2e67b_idx'),
+        ),
+    ]
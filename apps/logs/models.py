@@ -10,4 +10,7 @@ class Log(models.Model):
     error_message = models.TextField(null=True)
 
     class Meta:
-        ordering = ['-id']
\ No newline at end of file
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['event_type', 'id'])
+        ]
\ No newline at end of file
@@ -1,6 +1,7 @@
 from rest_framework.mixins import ListModelMixin
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.viewsets import GenericViewSet
+from apps.common.pagination import OptionalCursorPagination
 from apps.common.permisions import IsAdmin
 from apps.logs.models import Log
 from apps.logs.serializers import LogSerializer
@@ -12,4 +13,5 @@ class LogViewSet(GenericViewSet, ListModelMixin):
     queryset = Log.objects.all()
     serializer_class = LogSerializer
     permission_classes = (IsAuthenticated, IsAdmin,)
+    pagination_class = OptionalCursorPagination
     filterset_fields = ('event_type',)
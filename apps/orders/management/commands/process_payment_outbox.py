@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.orders.payments import process_outbox
+
+
+class Command(BaseCommand):
+    help = 'Create the Stripe PaymentIntents of new orders from the payment outbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Send the pending entries and exit.')
+        parser.add_argument('--batch-size', type=int, default=100, help='Entries sent between two polls.')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the outbox is empty.')
+
+    def handle(self, *args, **options):
+        while True:
+            handled = process_outbox(limit=options['batch_size'])
+            if handled:
+                self.stdout.write(f'Handled {handled} payment outbox entries.')
+
+            if options['once']:
+                break
+            if handled < options['batch_size']:
+                time.sleep(options['interval'])
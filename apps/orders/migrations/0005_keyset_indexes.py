@@ -0,0 +1,17 @@
+# Generated by Django 3.2.22 on 2026-10-18 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_auto_20231103_1721'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'id'], name='orders_orde_user_id_d0dd7c_idx'),
+        ),
+    ]
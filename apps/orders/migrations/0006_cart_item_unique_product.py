@@ -0,0 +1,52 @@
+# Generated by Django 3.2.22 on 2026-10-18 05:26
+
+from django.db import migrations, models
+
+# Concurrent item updates could add the same product twice. In carts that were never ordered the latest row
+# holds the count the user set, the others are dropped.
+DELETE_DUPLICATE_ITEMS = """
+DELETE FROM orders_cartitem duplicate
+USING orders_cartitem latest, orders_cart cart
+WHERE duplicate.cart_id = latest.cart_id
+  AND duplicate.product_id = latest.product_id
+  AND duplicate.id < latest.id
+  AND cart.id = duplicate.cart_id
+  AND NOT cart.is_archived
+  AND NOT EXISTS (SELECT 1 FROM orders_order WHERE orders_order.cart_id = cart.id);
+"""
+
+# Ordered carts were totalled over every row, so their duplicates are merged into the latest one instead,
+# the order keeps its units and its total.
+MERGE_DUPLICATE_ITEMS = """
+UPDATE orders_cartitem latest
+SET count = merged.count
+FROM (
+    SELECT MAX(id) AS id, SUM(count) AS count
+    FROM orders_cartitem
+    GROUP BY cart_id, product_id
+    HAVING COUNT(*) > 1
+) merged
+WHERE latest.id = merged.id;
+
+DELETE FROM orders_cartitem duplicate
+USING orders_cartitem latest
+WHERE duplicate.cart_id = latest.cart_id
+  AND duplicate.product_id = latest.product_id
+  AND duplicate.id < latest.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DELETE_DUPLICATE_ITEMS, migrations.RunSQL.noop),
+        migrations.RunSQL(MERGE_DUPLICATE_ITEMS, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='cart_item_unique_product'),
+        ),
+    ]
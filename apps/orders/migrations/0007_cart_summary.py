@@ -0,0 +1,41 @@
+# Generated by Django 3.2.22 on 2026-10-18 05:28
+
+from django.db import migrations, models
+
+FILL_CART_SUMMARY = """
+UPDATE orders_cart cart
+SET item_count = summary.item_count, estimated_total = summary.estimated_total
+FROM (
+    SELECT item.cart_id, SUM(item.count) AS item_count, SUM(product.effective_price * item.count) AS estimated_total
+    FROM orders_cartitem item
+    JOIN products_products product ON product.id = item.product_id
+    GROUP BY item.cart_id
+) summary
+WHERE summary.cart_id = cart.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_cart_item_unique_product'),
+        ('products', '0009_product_effective_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='estimated_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=11),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunSQL(FILL_CART_SUMMARY, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['user', 'is_archived'], name='orders_cart_user_id_8b2c5d_idx'),
+        ),
+    ]
@@ -1,13 +1,16 @@
-from drf_util.utils import gt
+import datetime
+from decimal import Decimal
 
-from apps.common.helpers import stripe, decimal_to_int_stripe
+from apps.common.cache import bump_generation
+from apps.common.helpers import decimal_to_int_stripe
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction, connection
 from django.db.models import Sum, F, Subquery, OuterRef, DecimalField
+from django.db.models.functions import Coalesce
 from rest_framework.exceptions import ValidationError
 
-from apps.products.models import Products
+from apps.products.models import Products, ProductSales
 from apps.users.models import User, UserAddress
 from apps.common.models import BaseModel
 
@@ -17,50 +20,117 @@ from apps.common.models import BaseModel
 class Cart(BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='carts')
     is_archived = models.BooleanField(default=False)
+    # Kept up to date by the item methods below, the total uses the prices at the time of the change
+    item_count = models.PositiveIntegerField(default=0)
+    estimated_total = models.DecimalField(max_digits=11, decimal_places=2, default=0)
 
     class Meta:
         ordering = ['-id']
+        indexes = [
+            models.Index(fields=['user', 'is_archived'])
+        ]
+
+    def lock(self):
+        """
+        Serialize the changes of this cart, so the summary is computed from the committed items.
+        """
+        Cart.objects.select_for_update().filter(id=self.id).exists()
+
+    def update_summary(self):
+        items = CartItem.objects.filter(cart=OuterRef('id')).order_by().values('cart')
+        Cart.objects.filter(id=self.id).update(
+            updated_at=datetime.datetime.now(),
+            item_count=Coalesce(Subquery(items.annotate(total=Sum('count')).values('total')), 0),
+            estimated_total=Coalesce(
+                Subquery(items.annotate(total=Sum(F('product__effective_price') * F('count'))).values('total')),
+                Decimal(0), output_field=DecimalField()
+            )
+        )
 
+    @transaction.atomic
     def add_item(self, product, count):
-
-        item = self.items.filter(product=product).first()
-        if item and not gt(item, 'count') == count:
-            item.count = count
-            item.save()
-
-        elif not item:
-            item = self.items.create(product=product, count=count)
-
+        """
+        Set the count of a product in the cart, adding it if needed.
+        """
+        self.lock()
+        item = self.upsert_items({product.id: count})[0]
+        self.update_summary()
         return item
 
+    @transaction.atomic
+    def remove_item(self, product):
+        self.lock()
+        self.items.filter(product=product).delete()
+        self.update_summary()
+
+    @transaction.atomic
+    def clear(self):
+        self.lock()
+        self.items.all().delete()
+        self.update_summary()
+
+    def upsert_items(self, counts):
+        """
+        Set the counts of several products, a product id -> count dict, with one INSERT ... ON CONFLICT statement.
+        """
+        if not counts:
+            return []
+
+        table = CartItem._meta.db_table
+        fields = CartItem._meta.concrete_fields
+        values = ', '.join(['(NOW(), NOW(), %s, %s, %s, 0)'] * len(counts))
+        params = [value for product_id, count in counts.items() for value in (self.id, product_id, count)]
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {table} (created_at, updated_at, cart_id, product_id, count, discount)
+                VALUES {values}
+                ON CONFLICT (cart_id, product_id) DO UPDATE
+                    SET count = EXCLUDED.count, updated_at = EXCLUDED.updated_at
+                RETURNING {', '.join(field.column for field in fields)}
+            """, params)
+            rows = cursor.fetchall()
+
+        return [CartItem.from_db(connection.alias, [field.attname for field in fields], row) for row in rows]
+
+    @transaction.atomic
+    def set_items(self, counts):
+        """
+        Apply product id -> count changes, a count of 0 removes the product.
+        """
+        self.lock()
+        removed, _ = self.items.filter(product_id__in=[product_id for product_id, count in counts.items()
+                                                       if not count]).delete()
+        updated = self.upsert_items({product_id: count for product_id, count in counts.items() if count})
+        self.update_summary()
+        return len(updated), removed
+
+    @transaction.atomic
     def create_order(self, user, address):
-
+        """
+        Create the order with its invoice. The Stripe PaymentIntent is created later by the payment outbox worker,
+        from the outbox row written in the same transaction.
+        """
         if not self.items.count():
             raise ValidationError({'cart': 'The cart is empty'})
 
-        price_subquery = Subquery(Products.objects.filter(id=OuterRef('product__id')).values('price')[:1])
-        discount_subquery = Subquery(Products.objects.filter(id=OuterRef('product__id')).values('discount')[:1])
+        deleted = list(self.items.filter(product__deleted_at__isnull=False)
+                       .order_by('product').values_list('product', flat=True))
+        if deleted:
+            raise ValidationError({'cart': f'Products no longer sold: {", ".join(map(str, deleted))}.'})
 
-        self.items.update(price=price_subquery, discount=discount_subquery)
+        price_subquery = Subquery(Products.all_objects.filter(id=OuterRef('product__id')).values('price')[:1])
+        discount_subquery = Subquery(Products.all_objects.filter(id=OuterRef('product__id')).values('discount')[:1])
 
-        total = self.items.aggregate(
-            total=Sum(F('price') * ((100 - F('discount')) / 100.0) * F('count'),
-                      output_field=DecimalField())).get('total')
+        self.items.update(price=price_subquery, discount=discount_subquery, updated_at=datetime.datetime.now())
 
-        order = Order.objects.create(user=user, address=address, cart=self, total=total)
-
-        stripe_amount = decimal_to_int_stripe(order.total)
-
-        payment_intent = stripe.PaymentIntent.create(
-            amount=stripe_amount,
-            currency="mdl",
-            metadata={'order_id': order.id, 'user_id': user.id},
-            automatic_payment_methods={'enabled': True, 'allow_redirects': 'never'}
-        )
+        total = self.items.aggregate(total=Sum(F('product__effective_price') * F('count'))).get('total')
 
-        Invoice.objects.create(order=order, stripe_id=payment_intent.id, user=user, amount=stripe_amount)
+        order = Order.objects.create(user=user, address=address, cart=self, total=total)
+        invoice = Invoice.objects.create(order=order, user=user, amount=decimal_to_int_stripe(order.total))
+        PaymentOutbox.objects.create(invoice=invoice)
 
-        return order, payment_intent
+        return order
 
 
 class CartItem(BaseModel):
@@ -72,6 +142,9 @@ class CartItem(BaseModel):
 
     class Meta:
         ordering = ['-id']
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='cart_item_unique_product')
+        ]
 
 
 class Order(BaseModel):
@@ -89,6 +162,31 @@ class Order(BaseModel):
 
     class Meta:
         ordering = ['-id']
+        indexes = [
+            models.Index(fields=['user', 'id'])
+        ]
+
+    def record_sales(self):
+        """
+        Add the units of this order to the daily sales rollup and to the product totals, one statement each.
+        """
+        items = CartItem._meta.db_table
+        sales = ProductSales._meta.db_table
+        products = Products._meta.db_table
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {sales} (product_id, day, sold)
+                SELECT product_id, %s, SUM(count) FROM {items} WHERE cart_id = %s GROUP BY product_id
+                ON CONFLICT (product_id, day) DO UPDATE SET sold = {sales}.sold + EXCLUDED.sold
+            """, [datetime.date.today(), self.cart_id])
+            cursor.execute(f"""
+                UPDATE {products} AS product SET sold = product.sold + item.sold, updated_at = NOW()
+                FROM (SELECT product_id, SUM(count) AS sold FROM {items} WHERE cart_id = %s GROUP BY product_id) AS item
+                WHERE product.id = item.product_id
+            """, [self.cart_id])
+
+        transaction.on_commit(lambda: bump_generation(Products))
 
 
 class Invoice(BaseModel):
@@ -100,6 +198,30 @@ class Invoice(BaseModel):
     status = models.CharField(max_length=32, choices=Status.choices, default=Status.REQUIRES_PAYMENT)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user')
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='order')
-    stripe_id = models.CharField(max_length=32)
+    stripe_id = models.CharField(max_length=32, null=True, blank=True)
+    client_secret = models.CharField(max_length=255, null=True, blank=True)
     amount = models.DecimalField(max_digits=9, decimal_places=2)
 
+
+class PaymentOutbox(BaseModel):
+    """
+    A PaymentIntent to create for an invoice, written with the invoice and sent by process_payment_outbox.
+    """
+    class Status(models.TextChoices):
+        PENDING = ('pending', 'Pending')
+        SENT = ('sent', 'Sent')
+        FAILED = ('failed', 'Failed')
+
+    invoice = models.OneToOneField(Invoice, on_delete=models.CASCADE, related_name='outbox')
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=datetime.datetime.now)
+    last_error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['available_at', 'id'], name='payment_outbox_pending',
+                         condition=models.Q(status='pending'))
+        ]
+
@@ -0,0 +1,83 @@
+import datetime
+
+from django.db import transaction
+
+from apps.common.helpers import stripe
+from apps.orders.models import Invoice, Order, PaymentOutbox
+from config import settings
+
+
+def create_payment_intent(invoice):
+    return stripe.PaymentIntent.create(
+        amount=int(invoice.amount),
+        currency="mdl",
+        metadata={'order_id': invoice.order_id, 'user_id': invoice.user_id},
+        automatic_payment_methods={'enabled': True, 'allow_redirects': 'never'},
+        # A worker that dies after Stripe answered retries the entry and gets the same intent back
+        idempotency_key=f'invoice-{invoice.id}',
+    )
+
+
+def process_outbox(limit=100):
+    """
+    Send up to `limit` pending PaymentIntents, returns how many entries were handled.
+    Entries are claimed with SKIP LOCKED in a short transaction, so several workers can run side by side,
+    and Stripe is called after it committed.
+    """
+    handled = 0
+    while handled < limit:
+        entry = claim()
+        if entry is None:
+            break
+
+        send(entry)
+        handled += 1
+
+    return handled
+
+
+@transaction.atomic
+def claim():
+    """
+    Take the next due entry for PAYMENT_OUTBOX_LEASE seconds. If the worker dies, the entry is due again after
+    the lease, the idempotency key makes the second call return the same intent.
+    """
+    entry = (PaymentOutbox.objects.select_for_update(skip_locked=True)
+             .filter(status=PaymentOutbox.Status.PENDING, available_at__lte=datetime.datetime.now())
+             .order_by('available_at', 'id').first())
+    if entry is None:
+        return None
+
+    entry.attempts += 1
+    entry.available_at = datetime.datetime.now() + datetime.timedelta(seconds=settings.PAYMENT_OUTBOX_LEASE)
+    entry.save(update_fields=['attempts', 'available_at', 'updated_at'])
+    return entry
+
+
+def send(entry):
+    invoice = Invoice.objects.get(id=entry.invoice_id)
+
+    try:
+        intent = create_payment_intent(invoice)
+    except stripe.error.StripeError as e:
+        entry.last_error = str(e)
+        # Invalid requests fail the same way every time
+        if isinstance(e, stripe.error.InvalidRequestError) or entry.attempts >= settings.PAYMENT_OUTBOX_MAX_ATTEMPTS:
+            entry.status = PaymentOutbox.Status.FAILED
+        else:
+            delay = min(2 ** entry.attempts, settings.PAYMENT_OUTBOX_MAX_DELAY)
+            entry.available_at = datetime.datetime.now() + datetime.timedelta(seconds=delay)
+    else:
+        entry.status = PaymentOutbox.Status.SENT
+        entry.last_error = None
+
+    now = datetime.datetime.now()
+    with transaction.atomic():
+        if entry.status == PaymentOutbox.Status.SENT:
+            Invoice.objects.filter(id=invoice.id).update(
+                stripe_id=intent.id, client_secret=intent.client_secret, updated_at=now)
+        elif entry.status == PaymentOutbox.Status.FAILED:
+            Invoice.objects.filter(id=invoice.id).update(status=Invoice.Status.CANCELED, updated_at=now)
+            Order.objects.filter(id=invoice.order_id).update(status=Order.Status.CANCELED, updated_at=now)
+
+        entry.save(update_fields=['status', 'available_at', 'last_error', 'updated_at'])
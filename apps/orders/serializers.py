@@ -1,15 +1,22 @@
-from django.db.models import Sum, F, DecimalField
+from decimal import Decimal
+
 from rest_framework import serializers
 
+from apps.common.serializers import SparseFieldsMixin
 from apps.users.serializers import UserAddressSerializer
-from apps.orders.models import Order, Cart, CartItem
+from apps.orders.models import Order, Cart, CartItem, Invoice
+from apps.products.models import Products
 from apps.products.serializers import ProductSerializer
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = '__all__'
+        expandable_fields = {
+            'cart': 'apps.orders.serializers.CartDetailsSerializer',
+            'address': 'apps.users.serializers.UserAddressSerializer',
+        }
 
         read_only_fields = [
             'id',
@@ -61,7 +68,20 @@ class CartSerializer(serializers.ModelSerializer):
             'updated_at',
             'user',
             'is_archived',
+            'item_count',
+            'estimated_total',
+        ]
+
+
+class CartSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Cart
+        fields = [
+            'id',
+            'item_count',
+            'estimated_total',
         ]
+        read_only_fields = fields
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -87,8 +107,33 @@ class CartItemSerializer(serializers.ModelSerializer):
         ]
 
 
+class CartItemRemoveSerializer(serializers.Serializer):
+    # Products that are no longer sold can still be removed
+    product = serializers.PrimaryKeyRelatedField(queryset=Products.all_objects.all())
+
+
+class CartItemCountSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    count = serializers.IntegerField(min_value=0, max_value=100, help_text='0 removes the product from the cart.')
+
+
+class CartItemsBulkSerializer(serializers.Serializer):
+    items = serializers.ListField(child=CartItemCountSerializer(), min_length=1, max_length=500)
+
+    def validate_items(self, value):
+        # Products that are no longer sold can still be removed
+        added = {item['product'] for item in value if item['count']}
+        existing = set(Products.objects.filter(id__in=added).values_list('id', flat=True))
+
+        if missing := sorted(added - existing):
+            raise serializers.ValidationError(f'Invalid products: {", ".join(map(str, missing))}.')
+        return value
+
+
 class CartItemDetailSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
+    subtotal = serializers.SerializerMethodField()
+    is_available = serializers.SerializerMethodField(help_text='False once the product is no longer sold.')
 
     class Meta:
         model = CartItem
@@ -99,8 +144,9 @@ class CartItemDetailSerializer(serializers.ModelSerializer):
             'product',
             'price',
             'discount',
-            'count'
-
+            'count',
+            'subtotal',
+            'is_available',
         ]
 
         read_only_fields = [
@@ -112,8 +158,14 @@ class CartItemDetailSerializer(serializers.ModelSerializer):
             'product'
         ]
 
+    def get_subtotal(self, obj):
+        return obj.product.effective_price * obj.count
 
-class CartDetailsSerializer(serializers.ModelSerializer):
+    def get_is_available(self, obj):
+        return obj.product.deleted_at is None
+
+
+class CartDetailsSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = CartItemDetailSerializer(many=True, read_only=True)
     total = serializers.SerializerMethodField()
 
@@ -127,21 +179,22 @@ class CartDetailsSerializer(serializers.ModelSerializer):
             'items',
             'total',
         ]
+        prefetch_fields = {'items': ['items__product__attachments'], 'total': ['items__product']}
 
     def get_total(self, obj):
-        total = obj.items.aggregate(
-            total=Sum(F('product__price') * ((100 - F('product__discount')) / 100.0) * F('count'),
-                      output_field=DecimalField())).get('total')
-        return total
+        # From the prefetched items when the view loaded them, products that are no longer sold can't be ordered
+        return sum((item.product.effective_price * item.count for item in obj.items.all()
+                    if item.product.deleted_at is None), Decimal(0))
 
 
-class OrderDetailSerializer(serializers.ModelSerializer):
+class OrderDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     cart = CartDetailsSerializer(read_only=True)
     address = UserAddressSerializer(read_only=True)
 
     class Meta:
         model = Order
         fields = '__all__'
+        prefetch_fields = {'cart': ['cart__items__product__attachments'], 'address': ['address']}
 
         read_only_fields = [
             'id',
@@ -151,4 +204,18 @@ class OrderDetailSerializer(serializers.ModelSerializer):
             'cart',
             'status',
             'total'
-        ]
\ No newline at end of file
+        ]
+
+
+class OrderPaymentSerializer(serializers.ModelSerializer):
+    intent_status = serializers.CharField(source='outbox.status', default=None)
+
+    class Meta:
+        model = Invoice
+        fields = [
+            'status',
+            'amount',
+            'client_secret',
+            'intent_status',
+        ]
+        read_only_fields = fields
@@ -1,3 +1,4 @@
+from decimal import Decimal
 from unittest import mock
 
 from django.test import TestCase
@@ -6,8 +7,12 @@ from drf_util.utils import gt
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from apps.orders.models import Order, Invoice
-from apps.products.models import Products
+from apps.common.fake_stripe import FakeStripeServer
+from apps.common.helpers import stripe
+from apps.orders.models import Order, Invoice, PaymentOutbox
+from apps.orders import payments
+from apps.orders.payments import process_outbox
+from apps.products.models import Products, ProductSales
 from apps.users.models import User, UserAddress
 
 
@@ -50,6 +55,62 @@ class TestCart(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertNotEquals(item.count, response.data['count'])
 
+    def test_add_item_upserts(self):
+        cart = self.user.get_user_cart(create_if_none=True)
+
+        with self.assertNumQueries(1):
+            item = cart.upsert_items({self.product1.id: 2})[0]
+
+        updated = cart.add_item(self.product1, 5)
+
+        self.assertEqual(updated.id, item.id)
+        self.assertEqual(updated.count, 5)
+        self.assertEqual(cart.items.get().count, 5)
+
+    def test_user_update_items_bulk(self):
+        self.client.force_authenticate(self.user)
+        cart = self.user.get_user_cart(create_if_none=True)
+        cart.add_item(self.product1, 2)
+
+        data = {'items': [{'product': self.product1.id, 'count': 0}, {'product': self.product2.id, 'count': 3}]}
+        response = self.client.post(reverse('cart-items-bulk'), data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'updated': 1, 'removed': 1})
+        self.assertEqual(list(cart.items.values_list('product', 'count')), [(self.product2.id, 3)])
+
+    def test_user_update_items_bulk_invalid_product_negative(self):
+        self.client.force_authenticate(self.user)
+
+        data = {'items': [{'product': self.product2.id, 'count': 1}, {'product': 999999, 'count': 1}]}
+        response = self.client.post(reverse('cart-items-bulk'), data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(self.user.carts.filter(items__isnull=False).exists())
+
+    def test_user_get_summary(self):
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(reverse('cart-summary'))
+        self.assertEqual(response.data['item_count'], 0)
+
+        cart = self.user.get_user_cart(create_if_none=True)
+        cart.add_item(self.product1, 2)
+        cart.add_item(self.product2, 1)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('cart-summary'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['item_count'], response.data['estimated_total']), (3, '211.09'))
+
+        cart.remove_item(self.product1)
+        self.assertEqual(self.client.get(reverse('cart-summary')).data['item_count'], 1)
+
+        cart.clear()
+        response = self.client.get(reverse('cart-summary'))
+        self.assertEqual((response.data['item_count'], response.data['estimated_total']), (0, '0.00'))
+
     def test_user_remove_item_from_cart(self):
         self.client.force_authenticate(self.user)
 
@@ -63,6 +124,18 @@ class TestCart(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_user_remove_deleted_item_from_cart(self):
+        self.client.force_authenticate(self.user)
+
+        user_cart = self.user.get_user_cart(create_if_none=True)
+        user_cart.add_item(self.product1, 2)
+        self.product1.delete()
+
+        response = self.client.post(reverse('cart-item-remove'), {'product': self.product1.id})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(user_cart.items.exists())
+
     def test_user_get_items(self):
         self.client.force_authenticate(self.user)
 
@@ -75,6 +148,74 @@ class TestCart(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['items']), 2)
 
+    def test_user_get_items_with_deleted_product(self):
+        self.client.force_authenticate(self.user)
+
+        user_cart = self.user.get_user_cart(create_if_none=True)
+        user_cart.add_item(self.product1, 2)
+        user_cart.add_item(self.product2, 1)
+        self.product1.delete()
+
+        response = self.client.get(reverse('cart-detail', kwargs={'pk': user_cart.id}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        availability = {item['product']['id']: item['is_available'] for item in response.data['items']}
+        self.assertEqual(availability, {self.product1.id: False, self.product2.id: True})
+        self.assertEqual(response.data['total'], Decimal('11.11'))
+
+    def test_user_get_items_constant_queries(self):
+        self.client.force_authenticate(self.user)
+        Products.objects.filter(id=self.product2.id).update(discount=10)
+
+        user_cart = self.user.get_user_cart(create_if_none=True)
+        user_cart.add_item(self.product1, 2)
+        self.product1.attachments.create(attachment='product/attachments/test.jpg')
+        url = reverse('cart-detail', kwargs={'pk': user_cart.id})
+
+        # Conditional GET aggregate, cart, items, products and attachments
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+        user_cart.add_item(self.product2, 3)
+
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+
+        subtotals = {item['product']['id']: item['subtotal'] for item in response.data['items']}
+        self.assertEqual(subtotals, {self.product1.id: Decimal('199.98'), self.product2.id: Decimal('30.00')})
+        self.assertEqual(response.data['total'], Decimal('229.98'))
+
+    def test_user_get_total_constant_queries(self):
+        self.client.force_authenticate(self.user)
+
+        user_cart = self.user.get_user_cart(create_if_none=True)
+        for index in range(8):
+            user_cart.add_item(Products.objects.create(name=f'bulk{index}', price=1, discount=0), 2)
+        url = reverse('cart-detail', kwargs={'pk': user_cart.id})
+
+        # Conditional GET aggregate, cart, items and products, without the attachments
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {'fields': 'total'})
+
+        self.assertEqual(response.data, {'total': Decimal('16.00')})
+
+    def test_user_get_items_not_modified(self):
+        self.client.force_authenticate(self.user)
+
+        user_cart = self.user.get_user_cart(create_if_none=True)
+        user_cart.add_item(self.product1, 2)
+        url = reverse('cart-detail', kwargs={'pk': user_cart.id})
+
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        user_cart.add_item(self.product2, 1)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['items']), 2)
+
     def test_user_add_item_invalid_count_negative(self):
         self.client.force_authenticate(self.user)
         data = {
@@ -129,6 +270,20 @@ class TestCart(TestCase):
 
 class TestOrders(TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stripe_server = FakeStripeServer().start()
+        cls.stripe_patch = mock.patch.multiple(
+            stripe, api_base=cls.stripe_server.url, api_key='sk_test_fake', max_network_retries=0)
+        cls.stripe_patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stripe_patch.stop()
+        cls.stripe_server.stop()
+        super().tearDownClass()
+
     def setUp(self) -> None:
         self.client = APIClient()
         self.user = User.objects.create(email='user@example.com', phone='+23560391790', is_active=True)
@@ -151,6 +306,23 @@ class TestOrders(TestCase):
         response = self.client.get(reverse('order-detail', kwargs={'pk': current_order.id}))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_user_get_order_sparse_fields(self):
+        self.client.force_authenticate(self.user)
+
+        cart = self.user.get_user_cart(create_if_none=True)
+        cart.add_item(self.product1, 2)
+        current_order = Order.objects.create(user=self.user, cart=cart, address=self.user_address, total=199.98)
+
+        # Conditional GET aggregate and the order
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('order-detail', kwargs={'pk': current_order.id}), {'fields': 'id,total'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {'id', 'total'})
+
+        response = self.client.get(reverse('order-detail', kwargs={'pk': current_order.id}), {'fields': 'id,cart'})
+        self.assertEqual(response.data['cart']['items'][0]['product']['id'], self.product1.id)
+
     def test_user_get_foreign_order(self):
         self.client.force_authenticate(self.other_user)
 
@@ -173,6 +345,20 @@ class TestOrders(TestCase):
         response = self.client.get(reverse('order-list'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_user_list_order_sparse_fields(self):
+        self.client.force_authenticate(self.user)
+
+        cart = self.user.get_user_cart(create_if_none=True)
+        cart.add_item(self.product1, 2)
+        Order.objects.create(user=self.user, cart=cart, address=self.user_address)
+
+        response = self.client.get(reverse('order-list'), {'fields': 'id,total,cart', 'expand': 'cart'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        order = response.data['results'][0]
+        self.assertEqual(set(order), {'id', 'total', 'cart'})
+        self.assertEqual(order['cart']['items'][0]['product']['id'], self.product1.id)
+
     def test_user_create_order(self):
         self.client.force_authenticate(self.user)
 
@@ -184,7 +370,75 @@ class TestOrders(TestCase):
         }
 
         response = self.client.post(reverse('cart-checkout'), data)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        invoice = Invoice.objects.get(order=gt(response.data, 'order.id'))
+        self.assertEqual((invoice.stripe_id, invoice.outbox.status), (None, PaymentOutbox.Status.PENDING))
+
+        response = self.client.get(response.data['payment'])
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertIsNone(response.data['client_secret'])
+
+        self.assertEqual(process_outbox(), 1)
+
+        response = self.client.get(reverse('order-payment', kwargs={'pk': invoice.order_id}))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['intent_status'], PaymentOutbox.Status.SENT)
+
+        invoice.refresh_from_db()
+        intent = self.stripe_server.intents[invoice.stripe_id]
+        self.assertEqual(response.data['client_secret'], intent['client_secret'])
+        self.assertEqual(intent['amount'], 21109)
+        self.assertEqual(intent['metadata'], {'order_id': str(invoice.order_id), 'user_id': str(self.user.id)})
+
+    def test_payment_outbox_retries_stripe_errors(self):
+        cart = self.user.get_user_cart(create_if_none=True)
+        cart.add_item(self.product1, 1)
+        order = cart.create_order(user=self.user, address=self.user_address)
+        outbox = PaymentOutbox.objects.get(invoice__order=order)
+
+        self.stripe_server.fail_next()
+        self.assertEqual(process_outbox(), 1)
+
+        outbox.refresh_from_db()
+        self.assertEqual((outbox.status, outbox.attempts), (PaymentOutbox.Status.PENDING, 1))
+        self.assertIsNotNone(outbox.last_error)
+        # Backing off, not picked up again right away
+        self.assertEqual(process_outbox(), 0)
+
+        PaymentOutbox.objects.filter(id=outbox.id).update(available_at=outbox.created_at)
+        self.assertEqual(process_outbox(), 1)
+
+        outbox.refresh_from_db()
+        self.assertEqual((outbox.status, outbox.attempts), (PaymentOutbox.Status.SENT, 2))
+        self.assertIsNotNone(Invoice.objects.get(order=order).client_secret)
+
+    def test_payment_outbox_lease(self):
+        cart = self.user.get_user_cart(create_if_none=True)
+        cart.add_item(self.product1, 1)
+        order = cart.create_order(user=self.user, address=self.user_address)
+
+        def create_payment_intent(invoice):
+            # Another worker polling while Stripe is being called does not get the claimed entry
+            self.assertEqual(process_outbox(), 0)
+            return create_intent(invoice)
+
+        create_intent = payments.create_payment_intent
+        with mock.patch('apps.orders.payments.create_payment_intent', side_effect=create_payment_intent):
+            self.assertEqual(process_outbox(), 1)
+
+        outbox = PaymentOutbox.objects.get(invoice__order=order)
+        self.assertEqual((outbox.status, outbox.attempts), (PaymentOutbox.Status.SENT, 1))
+
+    def test_user_get_foreign_order_payment(self):
+        self.client.force_authenticate(self.other_user)
+
+        cart = self.user.get_user_cart(create_if_none=True)
+        cart.add_item(self.product1, 1)
+        order = cart.create_order(user=self.user, address=self.user_address)
+
+        response = self.client.get(reverse('order-payment', kwargs={'pk': order.id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_user_create_order_empty_cart_negative(self):
         self.client.force_authenticate(self.user)
@@ -197,6 +451,20 @@ class TestOrders(TestCase):
         response = self.client.post(reverse('cart-checkout'), data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_user_create_order_deleted_product_negative(self):
+        self.client.force_authenticate(self.user)
+
+        cart = self.user.get_user_cart(create_if_none=True)
+        cart.add_item(self.product1, 2)
+        cart.add_item(self.product2, 1)
+        self.product1.delete()
+
+        response = self.client.post(reverse('cart-checkout'), {'address': self.user_address.id})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['cart'], f'Products no longer sold: {self.product1.id}.')
+        self.assertFalse(Order.objects.filter(cart=cart).exists())
+
     def test_user_create_order_foreign_address(self):
         self.client.force_authenticate(self.other_user)
 
@@ -295,6 +563,61 @@ class TestOrders(TestCase):
         invoice.refresh_from_db()
         self.assertEqual(invoice.status, Invoice.Status.SUCCEEDED)
 
+    def test_record_sales(self):
+        cart = self.user.get_user_cart(create_if_none=True)
+        cart.add_item(self.product1, 2)
+        cart.add_item(self.product2, 1)
+        order = Order.objects.create(user=self.user, cart=cart)
+
+        with self.assertNumQueries(2):
+            order.record_sales()
+        order.record_sales()
+
+        sold = dict(ProductSales.objects.values_list('product', 'sold'))
+        self.assertEqual(sold, {self.product1.id: 4, self.product2.id: 2})
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.sold, 4)
+
+    @mock.patch('apps.orders.models.Order.record_sales', side_effect=RuntimeError)
+    @mock.patch('apps.common.views.get_event_from_request')
+    def test_order_update_on_payment_rolled_back(self, mock_get_event_from_request, mock_record_sales):
+        cart = self.user.get_user_cart(create_if_none=True)
+        cart.add_item(self.product1, 1)
+        order = cart.create_order(user=self.user, address=self.user_address)
+
+        mock_get_event_from_request.return_value = {
+            'type': 'payment_intent.succeeded',
+            'data': {'object': {'metadata': {'order_id': order.id, 'user_id': self.user.id}}}
+        }
+        with self.assertRaises(RuntimeError):
+            self.client.post(reverse('webhooks-stripe'))
+
+        # Stripe's retry still finds the order to confirm
+        order.refresh_from_db()
+        cart.refresh_from_db()
+        self.assertEqual((order.status, cart.is_archived), (Order.Status.PENDING, False))
+        self.assertEqual(Invoice.objects.get(order=order).status, Invoice.Status.REQUIRES_PAYMENT)
+
+    @mock.patch('apps.common.views.get_event_from_request')
+    def test_user_get_order_modified_by_webhook(self, mock_get_event_from_request):
+        self.client.force_authenticate(self.user)
+
+        cart = self.user.get_user_cart(create_if_none=True)
+        cart.add_item(self.product1, 1)
+        order = cart.create_order(user=self.user, address=self.user_address)
+        url = reverse('order-detail', kwargs={'pk': order.id})
+        etag = self.client.get(url)['ETag']
+
+        mock_get_event_from_request.return_value = {
+            'type': 'payment_intent.canceled',
+            'data': {'object': {'metadata': {'order_id': order.id, 'user_id': self.user.id}}}
+        }
+        self.client.post(reverse('webhooks-stripe'))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], Order.Status.CANCELED)
+
     @mock.patch('apps.common.views.get_event_from_request')
     def test_order_update_on_payment_canceled(self, mock_get_event_from_request):
         self.client.force_authenticate(self.user)
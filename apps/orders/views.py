@@ -1,22 +1,31 @@
+import datetime
+
+from django.db.models import Max, Count
 from drf_util.utils import gt
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.serializers import Serializer
 from rest_framework.viewsets import mixins, GenericViewSet
 from rest_framework import status
 
+from apps.common.conditional import ConditionalRetrieveMixin
+from apps.common.pagination import OptionalCursorPagination
 from apps.common.permisions import IsAdmin, IsAdminOrOwner
-from apps.orders.models import Order, Cart
+from apps.orders.models import Order, Cart, Invoice, PaymentOutbox
 from apps.orders.serializers import OrderSerializer, CartSerializer, CartItemDetailSerializer, CartDetailsSerializer, \
-    OrderStatusSerializer, CartItemSerializer, OrderDetailSerializer
+    OrderStatusSerializer, CartItemSerializer, OrderDetailSerializer, CartItemsBulkSerializer, \
+    CartItemRemoveSerializer, CartSummarySerializer, OrderPaymentSerializer
 from apps.users.models import User
 from drf_util.views import BaseViewSet
 
 
-class OrderViewSet(BaseViewSet, mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.ListModelMixin):
+class OrderViewSet(ConditionalRetrieveMixin, BaseViewSet, mixins.RetrieveModelMixin, mixins.UpdateModelMixin,
+                   mixins.ListModelMixin):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    pagination_class = OptionalCursorPagination
     filterset_fields = ('user',)
     permission_classes_by_action = {
         "partial_update": (IsAuthenticated, IsAdmin,),
@@ -33,11 +42,24 @@ class OrderViewSet(BaseViewSet, mixins.RetrieveModelMixin, mixins.UpdateModelMix
         if gt(self.request.user, 'role') == User.Role.USER:
             qs = self.queryset.filter(user=self.request.user)
 
-        if self.action in ['detail']:
-            qs = self.queryset.select_related('address', 'cart')
+        if self.action == 'retrieve':
+            qs = qs.select_related('address', 'cart').prefetch_related('cart__items__product__attachments')
+
+        if self.action in ('list', 'retrieve'):
+            qs = self.get_serializer_class().sparse_queryset(qs, self.request)
 
         return qs
 
+    def get_conditional_aggregates(self):
+        return {
+            'last_modified': Max('updated_at'),
+            'address_modified': Max('address__updated_at'),
+            'cart_modified': Max('cart__updated_at'),
+            'items_modified': Max('cart__items__updated_at'),
+            'products_modified': Max('cart__items__product__updated_at'),
+            'items_count': Count('cart__items', distinct=True),
+        }
+
     def get_serializer_class(self):
         serializer = self.serializer_class
         if self.action in ['retrieve']:
@@ -55,6 +77,22 @@ class OrderViewSet(BaseViewSet, mixins.RetrieveModelMixin, mixins.UpdateModelMix
         instance.save()
         return Response(status.HTTP_200_OK)
 
+    @action(detail=True, methods=['GET'], serializer_class=OrderPaymentSerializer)
+    def payment(self, request, *args, **kwargs):
+        """
+        The invoice of the order, answered with 202 until its PaymentIntent client secret is ready.
+        """
+        order = self.get_object()
+        invoice = Invoice.objects.select_related('outbox').filter(order=order).first()
+        if invoice is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        outbox = getattr(invoice, 'outbox', None)
+        if outbox and outbox.status == PaymentOutbox.Status.PENDING:
+            return Response(self.get_serializer(invoice).data, status=status.HTTP_202_ACCEPTED,
+                            headers={'Retry-After': '1'})
+        return Response(self.get_serializer(invoice).data)
+
     @action(detail=True, methods=['PATCH'], serializer_class=OrderStatusSerializer,
             permission_classes=(IsAuthenticated, IsAdmin))
     def update_status(self, request, pk, *args, **kwargs):
@@ -62,15 +100,33 @@ class OrderViewSet(BaseViewSet, mixins.RetrieveModelMixin, mixins.UpdateModelMix
         serializer.is_valid(raise_exception=True)
         validated_data = serializer.validated_data
 
-        instance = Order.objects.filter(id=pk).update(**validated_data)
+        instance = Order.objects.filter(id=pk).update(**validated_data, updated_at=datetime.datetime.now())
         return Response(self.get_serializer(instance).data)
 
 
-class CartViewSet(GenericViewSet, mixins.RetrieveModelMixin):
+class CartViewSet(ConditionalRetrieveMixin, GenericViewSet, mixins.RetrieveModelMixin):
     queryset = Cart.objects.all()
     serializer_class = CartSerializer
     permission_classes = (IsAuthenticated, IsAdminOrOwner,)
 
+    def get_queryset(self):
+        qs = self.queryset
+
+        if self.action == 'retrieve':
+            qs = qs.prefetch_related('items__product__attachments')
+            # IsAdminOrOwner reads the owner
+            qs = self.get_serializer_class().sparse_queryset(qs, self.request, required_fields=('user',))
+
+        return qs
+
+    def get_conditional_aggregates(self):
+        return {
+            'last_modified': Max('updated_at'),
+            'items_modified': Max('items__updated_at'),
+            'products_modified': Max('items__product__updated_at'),
+            'items_count': Count('items', distinct=True),
+        }
+
     def get_serializer_class(self):
 
         if self.action in ['retrieve']:
@@ -78,6 +134,15 @@ class CartViewSet(GenericViewSet, mixins.RetrieveModelMixin):
 
         return self.serializer_class
 
+    @action(detail=False, methods=['GET'], serializer_class=CartSummarySerializer)
+    def summary(self, request, *args, **kwargs):
+        """
+        Item count and estimated total of the current cart, without loading its items.
+        """
+        cart = (Cart.objects.filter(user=request.user, is_archived=False)
+                .only('id', 'item_count', 'estimated_total').first())
+        return Response(self.get_serializer(cart or Cart()).data)
+
     @action(detail=False, methods=['POST'], serializer_class=OrderSerializer)
     def checkout(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -86,13 +151,14 @@ class CartViewSet(GenericViewSet, mixins.RetrieveModelMixin):
 
         cart = request.user.get_user_cart()
 
-        order, payment_intent = cart.create_order(user=self.request.user, address=validated_data['address'])
+        order = cart.create_order(user=self.request.user, address=validated_data['address'])
 
+        # The client secret is polled from the payment endpoint once the outbox worker created the intent
         response = {
             'order': self.get_serializer(order).data,
-            'client_secret': payment_intent.client_secret
+            'payment': reverse('order-payment', kwargs={'pk': order.id}, request=request)
         }
-        return Response(response)
+        return Response(response, status=status.HTTP_202_ACCEPTED)
 
     @action(detail=False, methods=['POST'], url_path='item-update', serializer_class=CartItemSerializer)
     def item_update(self, request, *args, **kwargs):
@@ -104,21 +170,35 @@ class CartViewSet(GenericViewSet, mixins.RetrieveModelMixin):
         item = user_cart.add_item(validated_data['product'], validated_data['count'])
         return Response(CartItemDetailSerializer(item).data)
 
-    @action(detail=False, methods=['POST'], url_path='item-remove', serializer_class=CartItemSerializer)
+    @action(detail=False, methods=['POST'], url_path='items-bulk', serializer_class=CartItemsBulkSerializer)
+    def items_bulk(self, request, *args, **kwargs):
+        """
+        Set the count of several products at once, a count of 0 removes the product.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        counts = {item['product']: item['count'] for item in serializer.validated_data['items']}
+
+        user_cart = self.request.user.get_user_cart(create_if_none=True)
+        updated, removed = user_cart.set_items(counts)
+
+        return Response({'updated': updated, 'removed': removed})
+
+    @action(detail=False, methods=['POST'], url_path='item-remove', serializer_class=CartItemRemoveSerializer)
     def item_remove(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         validated_data = serializer.validated_data
 
         user_cart = self.request.user.get_user_cart()
-        user_cart.items.filter(product=validated_data['product']).delete()
+        user_cart.remove_item(validated_data['product'])
 
         return Response(status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['POST'], serializer_class=Serializer)
     def clear(self, request, *args, **kwargs):
         user_cart = self.request.user.get_user_cart()
-        user_cart.items.all().delete()
+        user_cart.clear()
 
         return Response(status=status.HTTP_200_OK)
 
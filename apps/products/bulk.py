@@ -0,0 +1,134 @@
+import codecs
+import csv
+import datetime
+import json
+from collections import defaultdict
+
+from django.db import transaction
+from rest_framework import serializers
+
+from apps.common.cache import bump_generation
+from apps.products.models import Products, ProductCategory
+
+FIELDS = ['id', 'name', 'category', 'details', 'price', 'discount', 'specs']
+FORMATS = ('csv', 'jsonl')
+MAX_REPORTED_ERRORS = 100
+
+
+class ProductImportSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=False, allow_null=True, min_value=1)
+    name = serializers.CharField(max_length=255)
+    category = serializers.IntegerField(required=False, allow_null=True)
+    details = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    price = serializers.DecimalField(max_digits=9, decimal_places=2, min_value=0)
+    discount = serializers.IntegerField(min_value=0, max_value=99, default=0)
+    specs = serializers.CharField(required=False, allow_null=True, allow_blank=True, max_length=255)
+
+
+def read_rows(file, file_format):
+    """
+    Yield (line number, row) from a binary UTF-8 CSV or JSON lines file, one line at a time.
+    """
+    # utf-8-sig drops the byte order mark spreadsheet apps put before the header
+    lines = codecs.iterdecode(file, 'utf-8-sig')
+
+    if file_format == 'csv':
+        for line, row in enumerate(csv.DictReader(lines), start=2):
+            # Empty cells are missing values, not empty strings
+            yield line, {key: value for key, value in row.items() if value != ''}
+    else:
+        for line, text in enumerate(lines, start=1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except ValueError:
+                    yield line, text
+
+
+def import_products(rows, batch_size=1000):
+    """
+    Create or update products from (line number, row) pairs with one bulk query per batch.
+    Updates only write the columns present in the row, invalid rows are skipped and reported.
+    """
+    result = {'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+
+    batch = []
+    for line, row in rows:
+        serializer = ProductImportSerializer(data=row)
+        if not serializer.is_valid():
+            add_error(result, line, serializer.errors)
+            continue
+
+        batch.append((line, serializer.validated_data, [field for field in FIELDS[1:] if field in row]))
+        if len(batch) == batch_size:
+            save_batch(batch, result)
+            batch = []
+
+    save_batch(batch, result)
+
+    if result['created'] or result['updated']:
+        bump_generation(Products)
+    return result
+
+
+def add_error(result, line, errors):
+    result['failed'] += 1
+    if len(result['errors']) < MAX_REPORTED_ERRORS:
+        result['errors'].append({'line': line, 'errors': errors})
+
+
+def save_batch(batch, result):
+    category_ids = {data['category'] for _, data, _ in batch if data.get('category')}
+    categories = set(ProductCategory.objects.filter(id__in=category_ids).values_list('id', flat=True))
+
+    product_ids = {data['id'] for _, data, _ in batch if data.get('id')}
+    existing = set(Products.all_objects.filter(id__in=product_ids).values_list('id', flat=True))
+
+    now = datetime.datetime.now()
+    # Rows updating the same columns share a bulk update
+    to_create, to_update = [], defaultdict(list)
+    for line, data, fields in batch:
+        category_id = data.pop('category', None)
+        if category_id and category_id not in categories:
+            add_error(result, line, {'category': f'Category {category_id} does not exist.'})
+            continue
+
+        product_id = data.pop('id', None)
+        if product_id and product_id not in existing:
+            add_error(result, line, {'id': f'Product {product_id} does not exist.'})
+            continue
+
+        product = Products(id=product_id, category_id=category_id, updated_at=now, **data)
+        if product_id:
+            to_update[tuple(fields)].append(product)
+        else:
+            to_create.append(product)
+
+    with transaction.atomic():
+        Products.objects.bulk_create(to_create)
+        for fields, products in to_update.items():
+            Products.all_objects.bulk_update(products, [*fields, 'updated_at'])
+
+    result['created'] += len(to_create)
+    result['updated'] += sum(len(products) for products in to_update.values())
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def export_products(queryset, file_format):
+    """
+    Yield the products as CSV or JSON lines, reading them from the database in chunks.
+    """
+    rows = queryset.order_by('id').values_list('id', 'name', 'category_id', 'details', 'price', 'discount', 'specs')
+
+    if file_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(FIELDS)
+        for row in rows.iterator(chunk_size=2000):
+            yield writer.writerow(row)
+    else:
+        for row in rows.iterator(chunk_size=2000):
+            yield json.dumps(dict(zip(FIELDS, row)), default=str) + '\n'
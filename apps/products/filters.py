@@ -0,0 +1,65 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, Count, Value
+from django.db.models.functions import Floor
+from django_filters import rest_framework as filters
+
+from apps.products.models import Products, ProductCategory
+
+
+class ProductFilter(filters.FilterSet):
+    search = filters.CharFilter(method='filter_search')
+    category_tree = filters.NumberFilter(method='filter_category_tree')
+    rating_min = filters.NumberFilter(field_name='rating_avg', lookup_expr='gte')
+    price_min = filters.NumberFilter(field_name='price', lookup_expr='gte')
+    price_max = filters.NumberFilter(field_name='price', lookup_expr='lte')
+    effective_price_min = filters.NumberFilter(field_name='effective_price', lookup_expr='gte')
+    effective_price_max = filters.NumberFilter(field_name='effective_price', lookup_expr='lte')
+    discount_min = filters.NumberFilter(field_name='discount', lookup_expr='gte')
+    discount_max = filters.NumberFilter(field_name='discount', lookup_expr='lte')
+    has_discount = filters.BooleanFilter(method='filter_has_discount')
+    ordering = filters.OrderingFilter(fields=(
+        ('rating_avg', 'rating'), ('price', 'price'), ('effective_price', 'effective_price'), ('id', 'id')))
+
+    class Meta:
+        model = Products
+        fields = ['category']
+
+    def filter_category_tree(self, queryset, name, value):
+        path = ProductCategory.objects.filter(id=value).values_list('path', flat=True).first()
+        if not path:
+            return queryset.none()
+        return queryset.filter(category__path__startswith=path)
+
+    def filter_has_discount(self, queryset, name, value):
+        return queryset.filter(discount__gt=0) if value else queryset.filter(discount=0)
+
+    def filter_search(self, queryset, name, value):
+        query = SearchQuery(value, search_type='websearch', config='english')
+        return (queryset.filter(search_vector=query)
+                .annotate(rank=SearchRank(F('search_vector'), query)).order_by('-rank', '-id'))
+
+    def facet_queryset(self, *ignored):
+        """
+        The filtered products without the facet's own filters, so a selected value still shows its alternatives.
+        """
+        data = self.data.copy()
+        for name in ignored:
+            data.pop(name, None)
+        return type(self)(data, queryset=self.queryset, request=self.request).qs.order_by()
+
+    def get_facets(self, price_step):
+        """
+        Product counts per category and per price bucket, one grouped query each.
+        """
+        categories = (self.facet_queryset('category', 'category_tree')
+                      .values('category').annotate(count=Count('id')).order_by('-count', 'category_id'))
+
+        prices = (self.facet_queryset('price_min', 'price_max')
+                  .annotate(bucket=Floor(F('price') / Value(price_step)) * Value(price_step))
+                  .values('bucket').annotate(count=Count('id')).order_by('bucket'))
+
+        return {
+            'categories': list(categories),
+            'prices': [{'from': row['bucket'], 'to': row['bucket'] + price_step, 'count': row['count']}
+                       for row in prices],
+        }
@@ -0,0 +1,27 @@
+import itertools
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from apps.orders.models import CartItem
+from apps.products.models import ProductNeighbour
+from apps.products.recommendations import bought_together, replace_neighbours
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the "bought together" recommendations from the items of paid carts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=20, help='Neighbours stored per product.')
+        parser.add_argument('--min-count', type=int, default=2, help='Carts a pair must share to be recommended.')
+
+    def handle(self, *args, **options):
+        rows = (CartItem.objects.filter(cart__is_archived=True)
+                .values_list('cart_id', 'product_id').order_by().iterator(chunk_size=10000))
+        pairs = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64).reshape(-1, 2)
+
+        neighbours = bought_together(pairs, k=options['top_k'], min_count=options['min_count'])
+        replace_neighbours(ProductNeighbour.Kind.BOUGHT_TOGETHER, neighbours)
+
+        count = ProductNeighbour.objects.filter(kind=ProductNeighbour.Kind.BOUGHT_TOGETHER).count()
+        self.stdout.write(self.style.SUCCESS(f'Stored {count} recommendations from {len(pairs)} cart items.'))
@@ -0,0 +1,89 @@
+import itertools
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from scipy import sparse
+
+from apps.products.models import Products, ProductNeighbour
+from apps.products.recommendations import count_terms, load_index, save_index, text_digest, tfidf, \
+    most_similar, replace_neighbours
+from config import settings
+
+KIND = ProductNeighbour.Kind.SIMILAR
+
+
+def product_texts(queryset):
+    for product_id, name, specs, details in (queryset.order_by('id')
+                                             .values_list('id', 'name', 'specs', 'details')
+                                             .iterator(chunk_size=5000)):
+        yield product_id, ' '.join(filter(None, (name, specs, details)))
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the "similar products" recommendations for the products whose text changed since the last run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild every product and reset the vocabulary.')
+        parser.add_argument('--top-k', type=int, default=20, help='Neighbours stored per product.')
+
+    def handle(self, *args, **options):
+        path = settings.SIMILAR_PRODUCTS_INDEX
+        started = timezone.now()
+        index = None if options['full'] else load_index(path)
+        rebuild_all = index is None
+
+        if rebuild_all:
+            index = {'product_ids': np.zeros(0, dtype=np.int64), 'digests': np.zeros(0, dtype=np.uint64),
+                     'counts': sparse.csr_matrix((0, 0), dtype=np.float32), 'vocabulary': {}}
+            changed = Products.objects.all()
+        else:
+            changed = Products.objects.filter(updated_at__gt=index['built_at'])
+
+        # Ratings and sales also touch updated_at, only a different text needs new counts
+        stored = dict(zip(index['product_ids'].tolist(), index['digests'].tolist()))
+        texts = {product_id: text for product_id, text in product_texts(changed)
+                 if stored.get(product_id) != text_digest(text)}
+
+        live = set(Products.objects.values_list('id', flat=True).iterator(chunk_size=10000))
+        removed = [product_id for product_id in stored if product_id not in live]
+        keep = np.array([product_id in live and product_id not in texts for product_id in stored], dtype=bool)
+
+        vocabulary = index['vocabulary']
+        new_counts = count_terms(texts.values(), vocabulary)
+        old_counts = index['counts'][keep]
+        old_counts = sparse.csr_matrix((old_counts.data, old_counts.indices, old_counts.indptr),
+                                       shape=(old_counts.shape[0], len(vocabulary)))
+
+        product_ids = np.concatenate([index['product_ids'][keep], np.fromiter(texts, dtype=np.int64)])
+        digests = np.concatenate([index['digests'][keep],
+                                  np.fromiter(map(text_digest, texts.values()), dtype=np.uint64)])
+        counts = sparse.vstack([old_counts, new_counts], format='csr')
+        weights = tfidf(counts)
+
+        positions = {product_id: position for position, product_id in enumerate(product_ids.tolist())}
+
+        def similar_to(ids):
+            rows = np.fromiter((positions[product_id] for product_id in ids), dtype=np.int64)
+            return most_similar(weights, product_ids, rows, k=options['top_k'])
+
+        if rebuild_all:
+            targets = product_ids.tolist()
+            neighbours = similar_to(targets)
+        else:
+            first = list(similar_to(texts))
+            # Products close to a changed product, or listing a changed or removed one, are refreshed too
+            listing = (ProductNeighbour.objects.filter(kind=KIND, neighbour_id__in=list(texts) + removed)
+                       .values_list('product_id', flat=True))
+            affected = {neighbour_id for _, neighbour_id, _, _ in first} | set(listing)
+            others = sorted((affected & live) - texts.keys())
+
+            targets = list(texts) + others
+            neighbours = itertools.chain(first, similar_to(others))
+
+        replace_neighbours(KIND, neighbours, product_ids=None if rebuild_all else targets + removed)
+        save_index(path, {'product_ids': product_ids, 'digests': digests, 'counts': counts,
+                          'vocabulary': vocabulary, 'built_at': started})
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated the similar products of {len(targets)} products, {len(texts)} texts changed.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.uploads import expire_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete the abandoned resumable uploads and their partial files.'
+
+    def handle(self, *args, **options):
+        count = expire_sessions()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {count} expired uploads.'))
@@ -0,0 +1,29 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products.bulk import FORMATS, import_products, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Create or update products from a CSV or JSON lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise CommandError(f'Unknown format "{file_format}", use one of {", ".join(FORMATS)}.')
+
+        with open(path, 'rb') as file:
+            result = import_products(read_rows(file, file_format), batch_size=options['batch_size'])
+
+        for error in result['errors']:
+            self.stderr.write(f'Line {error["line"]}: {json.dumps(error["errors"])}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {result["created"]}, updated {result["updated"]}, failed {result["failed"]} products.'))
@@ -0,0 +1,46 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum, Q
+
+from apps.common.cache import bump_generation
+from apps.products.models import Products, ProductReview
+
+RATING_FIELDS = ['rating_count', 'rating_sum', 'rating_avg', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+
+
+class Command(BaseCommand):
+    help = 'Recompute the rating aggregates of every product from its reviews.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        aggregates = (ProductReview.objects.values('product')
+                      .annotate(rating_count=Count('id'), rating_sum=Sum('rating'),
+                                **{f'rating_{rating}': Count('id', filter=Q(rating=rating)) for rating in range(1, 6)})
+                      .order_by('product'))
+
+        updated = 0
+        with transaction.atomic():
+            Products.all_objects.update(**{field: 0 for field in RATING_FIELDS})
+
+            batch = []
+            for row in aggregates.iterator():
+                product = Products(id=row.pop('product'), **row)
+                product.rating_avg = round(Decimal(product.rating_sum) / product.rating_count, 2)
+                batch.append(product)
+
+                if len(batch) == batch_size:
+                    Products.all_objects.bulk_update(batch, RATING_FIELDS)
+                    updated += len(batch)
+                    batch = []
+
+            Products.all_objects.bulk_update(batch, RATING_FIELDS)
+            updated += len(batch)
+
+        bump_generation(Products)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the ratings of {updated} products.'))
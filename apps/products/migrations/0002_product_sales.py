@@ -0,0 +1,63 @@
+# Generated by Django 3.2.22 on 2026-10-18 04:59
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def backfill_sales(apps, schema_editor):
+    CartItem = apps.get_model('orders', 'CartItem')
+    Products = apps.get_model('products', 'Products')
+    ProductSales = apps.get_model('products', 'ProductSales')
+
+    rows = (CartItem.objects.filter(cart__order__status__in=['confirmed', 'completed'])
+            .annotate(day=TruncDate('cart__order__updated_at'))
+            .values('product', 'day').annotate(sold=Sum('count')).order_by())
+
+    totals = {}
+    sales = []
+    for row in rows:
+        sales.append(ProductSales(product_id=row['product'], day=row['day'], sold=row['sold']))
+        totals[row['product']] = totals.get(row['product'], 0) + row['sold']
+
+    ProductSales.objects.bulk_create(sales, batch_size=1000)
+    for product_id, sold in totals.items():
+        Products.objects.filter(id=product_id).update(sold=sold)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+        ('orders', '0004_auto_20231103_1721'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='sold',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.CreateModel(
+            name='ProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('sold', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales', to='products.products')),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productsales',
+            index=models.Index(fields=['day', 'product'], name='products_pr_day_dc1068_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productsales',
+            unique_together={('product', 'day')},
+        ),
+        migrations.RunPython(backfill_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.22 on 2026-10-18 05:02
+
+from django.db import migrations, models
+
+
+def fill_category_paths(apps, schema_editor):
+    ProductCategory = apps.get_model('products', 'ProductCategory')
+
+    parents = dict(ProductCategory.objects.values_list('id', 'child_of_id'))
+
+    for category_id in parents:
+        ids = []
+        node, seen = category_id, set()
+        while node is not None and node not in seen:
+            seen.add(node)
+            ids.append(node)
+            node = parents.get(node)
+        path = ''.join(f'{node}/' for node in reversed(ids))
+        ProductCategory.objects.filter(id=category_id).update(path=path)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_name_trigram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productcategory',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+    ]
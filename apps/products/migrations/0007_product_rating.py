@@ -0,0 +1,83 @@
+# Generated by Django 3.2.22 on 2026-10-18 05:04
+
+from django.db import migrations, models
+
+FILL_RATINGS = """
+UPDATE products_products AS product
+SET rating_count = reviews.rating_count,
+    rating_sum = reviews.rating_sum,
+    rating_avg = round(reviews.rating_sum::numeric / reviews.rating_count, 2),
+    rating_1 = reviews.rating_1,
+    rating_2 = reviews.rating_2,
+    rating_3 = reviews.rating_3,
+    rating_4 = reviews.rating_4,
+    rating_5 = reviews.rating_5
+FROM (
+    SELECT product_id,
+           count(*) AS rating_count,
+           sum(rating) AS rating_sum,
+           count(*) FILTER (WHERE rating = 1) AS rating_1,
+           count(*) FILTER (WHERE rating = 2) AS rating_2,
+           count(*) FILTER (WHERE rating = 3) AS rating_3,
+           count(*) FILTER (WHERE rating = 4) AS rating_4,
+           count(*) FILTER (WHERE rating = 5) AS rating_5
+    FROM products_productreview
+    GROUP BY product_id
+) AS reviews
+WHERE product.id = reviews.product_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_category_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['rating_avg', 'id'], name='products_pr_rating__a2ddd2_idx'),
+        ),
+        migrations.RunSQL(FILL_RATINGS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.22 on 2026-10-18 05:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_rating'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='products',
+            name='products_pr_categor_a0b565_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='products',
+            name='products_pr_rating__a2ddd2_idx',
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['id'], name='products_live_id'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['category', 'id'], name='products_live_category'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['price', 'id'], name='products_live_price'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['rating_avg', 'id'], name='products_live_rating'),
+        ),
+    ]
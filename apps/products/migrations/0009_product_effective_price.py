@@ -0,0 +1,43 @@
+# Generated by Django 3.2.22 on 2026-10-18 05:13
+
+from django.db import migrations, models
+
+EFFECTIVE_PRICE_TRIGGER = """
+CREATE FUNCTION products_effective_price_update() RETURNS trigger AS $$
+BEGIN
+    NEW.effective_price := round(NEW.price * (100 - NEW.discount) / 100, 2);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER products_effective_price_trigger
+    BEFORE INSERT OR UPDATE OF price, discount, effective_price ON products_products
+    FOR EACH ROW EXECUTE FUNCTION products_effective_price_update();
+
+UPDATE products_products SET effective_price = 0;
+"""
+
+DROP_EFFECTIVE_PRICE_TRIGGER = """
+DROP TRIGGER IF EXISTS products_effective_price_trigger ON products_products;
+DROP FUNCTION IF EXISTS products_effective_price_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=9),
+        ),
+        migrations.RunSQL(EFFECTIVE_PRICE_TRIGGER, DROP_EFFECTIVE_PRICE_TRIGGER),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['effective_price', 'id'], name='products_live_effective_price'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.22 on 2026-10-18 05:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_neighbour'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productneighbour',
+            name='kind',
+            field=models.CharField(choices=[('bought_together', 'Bought together'), ('similar', 'Similar')], max_length=32),
+        ),
+    ]
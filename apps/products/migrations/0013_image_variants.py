@@ -0,0 +1,37 @@
+# Generated by Django 3.2.22 on 2026-10-18 06:03
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+from apps.common.images import variant_name
+
+
+def fill_image_variants(apps, schema_editor):
+    # Images uploaded before the variants were recorded, a last storage lookup each
+    for model_name, field in (('ProductAttachments', 'attachment'), ('ProductCategory', 'img')):
+        model = apps.get_model('products', model_name)
+        for pk, name in model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).values_list(
+                'id', field).iterator():
+            if default_storage.exists(variant_name(name, 'thumbnail')):
+                model.objects.filter(id=pk).update(**{f'{field}_variants': name})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_product_neighbour_similar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productattachments',
+            name='attachment_variants',
+            field=models.CharField(default=None, editable=False, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='productcategory',
+            name='img_variants',
+            field=models.CharField(default=None, editable=False, max_length=100, null=True),
+        ),
+        migrations.RunPython(fill_image_variants, migrations.RunPython.noop),
+    ]
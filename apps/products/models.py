@@ -1,8 +1,15 @@
 import datetime
+import uuid
+from decimal import Decimal, ROUND_HALF_UP
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Value, F, Q, Case, When, DecimalField
+from django.db.models.functions import Concat, Substr, Cast
 
+from apps.common.cache import bump_generation
 from apps.users.models import User
 from apps.common.models import BaseModel
 
@@ -12,12 +19,57 @@ from apps.common.models import BaseModel
 class ProductCategory(BaseModel):
     name = models.CharField(max_length=255)
     img = models.ImageField(null=True)
+    # Name of the image its variants were generated for, see ImageVariantsField
+    img_variants = models.CharField(max_length=100, null=True, default=None, editable=False)
     child_of = models.ForeignKey('self', null=True, on_delete=models.SET_NULL)
+    # Ids from the root down to this category, e.g. "1/5/12/"
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
 
     class Meta:
 
         ordering = ['-id']
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            parent_path = self.child_of.path if self.child_of_id else ''
+            path = f'{parent_path}{self.id}/'
+
+            if path != self.path:
+                ProductCategory.objects.filter(id=self.id).update(path=path)
+                if self.path:
+                    ProductCategory.objects.filter(path__startswith=self.path).update(
+                        path=Concat(Value(path), Substr('path', len(self.path) + 1)))
+                self.path = path
+
+    def get_descendants(self, include_self=True):
+        queryset = ProductCategory.objects.filter(path__startswith=self.path)
+        if not include_self:
+            queryset = queryset.exclude(id=self.id)
+        return queryset
+
+
+class ProductQuerySet(models.QuerySet):
+
+    def delete(self):
+        """
+        Soft delete the products with a single UPDATE.
+        """
+        count = self.update(deleted_at=datetime.datetime.now(), updated_at=datetime.datetime.now())
+        bump_generation(self.model)
+        return count, {self.model._meta.label: count}
+
+    def restore(self):
+        count = self.update(deleted_at=None, updated_at=datetime.datetime.now())
+        bump_generation(self.model)
+        return count
+
+
+class LiveProductManager(models.Manager.from_queryset(ProductQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 
 class Products(BaseModel):
     deleted_at = models.DateTimeField(null=True, default=None)
@@ -26,16 +78,84 @@ class Products(BaseModel):
     details = models.TextField(null=True, default=None)
     price = models.DecimalField(max_digits=9, decimal_places=2)
     discount = models.PositiveSmallIntegerField(validators=[MinValueValidator(0), MaxValueValidator(99)])
+    # What the customer pays, set on save and by a database trigger for bulk writes
+    effective_price = models.DecimalField(max_digits=9, decimal_places=2, default=0, editable=False)
     specs = models.CharField(max_length=255, null=True)
+    sold = models.PositiveIntegerField(default=0, db_index=True)
+    # Filled by a database trigger from name, specs and details
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Review aggregates, kept up to date by update_rating
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
+    # Products that are not soft deleted, all_objects includes them
+    objects = LiveProductManager()
+    all_objects = ProductQuerySet.as_manager()
 
     class Meta:
 
         ordering = ['-id']
+        indexes = [
+            models.Index(fields=['id'], name='products_live_id', condition=Q(deleted_at__isnull=True)),
+            models.Index(fields=['category', 'id'], name='products_live_category',
+                         condition=Q(deleted_at__isnull=True)),
+            models.Index(fields=['price', 'id'], name='products_live_price', condition=Q(deleted_at__isnull=True)),
+            models.Index(fields=['effective_price', 'id'], name='products_live_effective_price',
+                         condition=Q(deleted_at__isnull=True)),
+            models.Index(fields=['rating_avg', 'id'], name='products_live_rating',
+                         condition=Q(deleted_at__isnull=True)),
+            GinIndex(fields=['search_vector']),
+            GinIndex(fields=['name'], name='products_name_trgm', opclasses=['gin_trgm_ops'])
+        ]
+
+    def save(self, *args, **kwargs):
+        # Rounded like the trigger, which uses numeric round()
+        self.effective_price = (Decimal(str(self.price)) * (100 - self.discount) / 100).quantize(
+            Decimal('0.01'), rounding=ROUND_HALF_UP)
+        super().save(*args, **kwargs)
 
     def delete(self, using=None, keep_parents=False):
         self.deleted_at = datetime.datetime.now()
         self.save()
 
+    def restore(self):
+        self.deleted_at = None
+        self.save()
+
+    @classmethod
+    def update_rating(cls, product_id, added=None, removed=None):
+        """
+        Apply one review change to the stored aggregates, `added` and `removed` are ratings.
+        """
+        count_delta = (added is not None) - (removed is not None)
+        sum_delta = (added or 0) - (removed or 0)
+
+        changes = {
+            'updated_at': datetime.datetime.now(),
+            'rating_count': F('rating_count') + count_delta,
+            'rating_sum': F('rating_sum') + sum_delta,
+            'rating_avg': Case(
+                When(rating_count=-count_delta, then=Value(0)),
+                default=(Cast(F('rating_sum') + sum_delta, DecimalField(max_digits=12, decimal_places=4))
+                         / (F('rating_count') + count_delta)),
+                output_field=DecimalField(max_digits=3, decimal_places=2)
+            )
+        }
+        if added != removed:
+            if added:
+                changes[f'rating_{added}'] = F(f'rating_{added}') + 1
+            if removed:
+                changes[f'rating_{removed}'] = F(f'rating_{removed}') - 1
+
+        cls.all_objects.filter(id=product_id).update(**changes)
+        bump_generation(cls)
+
 
 class ProductReview(BaseModel):
     product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='reviews')
@@ -45,11 +165,81 @@ class ProductReview(BaseModel):
 
     class Meta:
         ordering = ['-id']
+        indexes = [
+            models.Index(fields=['product', 'id']),
+            models.Index(fields=['rating', 'id'])
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.stored_rating = (instance.__dict__.get('product_id'), instance.__dict__.get('rating'))
+        return instance
 
 
 class ProductAttachments(BaseModel):
     product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='attachments')
     attachment = models.ImageField(upload_to='product/attachments')
+    # Name of the image its variants were generated for, see ImageVariantsField
+    attachment_variants = models.CharField(max_length=100, null=True, default=None, editable=False)
 
     class Meta:
         ordering = ['-id']
+
+
+class ProductSales(models.Model):
+    """
+    Units sold per product and day, filled in when a payment is confirmed.
+    """
+    product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='sales')
+    day = models.DateField()
+    sold = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-day']
+        unique_together = ('product', 'day')
+        indexes = [
+            models.Index(fields=['day', 'product'])
+        ]
+
+
+class ProductNeighbour(models.Model):
+    """
+    Precomputed top-K recommendations per product, rebuilt offline by management commands.
+    """
+    class Kind(models.TextChoices):
+        BOUGHT_TOGETHER = ('bought_together', 'Bought together')
+        SIMILAR = ('similar', 'Similar')
+
+    product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='neighbours')
+    neighbour = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=32, choices=Kind.choices)
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['rank']
+        unique_together = ('product', 'kind', 'rank')
+
+
+class UploadSession(BaseModel):
+    """
+    A resumable attachment upload, assembled chunk by chunk under MEDIA_ROOT/uploads until it is finalized.
+    """
+    class Status(models.TextChoices):
+        OPEN = ('open', 'Open')
+        COMPLETE = ('complete', 'Complete')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    checksum = models.CharField(max_length=64, help_text='SHA-256 of the whole file, hex encoded.')
+    # Bytes stored contiguously from the start of the file
+    received = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.OPEN)
+    attachment = models.ForeignKey(ProductAttachments, null=True, default=None, on_delete=models.SET_NULL)
+
+    class Meta:
+        ordering = ['-created_at']
@@ -0,0 +1,187 @@
+import datetime
+import hashlib
+import os
+import re
+from collections import Counter
+
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from apps.common.cache import bump_generation
+from apps.products.models import ProductNeighbour, Products
+
+
+def top_k(matrix, row_ids, column_ids, k):
+    """
+    Yield (product id, neighbour id, score, rank) for the k highest scores of every row of a CSR matrix.
+    """
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        if start == end:
+            continue
+
+        scores = matrix.data[start:end]
+        columns = matrix.indices[start:end]
+        best = np.argsort(-scores, kind='stable')[:k]
+
+        for rank, index in enumerate(best, start=1):
+            yield int(row_ids[row]), int(column_ids[columns[index]]), float(scores[index]), rank
+
+
+def bought_together(pairs, k=20, min_count=2):
+    """
+    Score product pairs by how often they share a cart, from (cart id, product id) pairs.
+    The score is the cosine of the product columns of the cart x product matrix, so best sellers
+    do not end up next to every product.
+    """
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    if not len(pairs):
+        return iter(())
+
+    cart_ids, carts = np.unique(pairs[:, 0], return_inverse=True)
+    product_ids, products = np.unique(pairs[:, 1], return_inverse=True)
+
+    baskets = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (carts, products)), shape=(len(cart_ids), len(product_ids)))
+    # A product appearing twice in a cart still counts once
+    baskets.sum_duplicates()
+    baskets.data[:] = 1
+
+    together = (baskets.T @ baskets).tocsr()
+    together.setdiag(0)
+    together.data[together.data < min_count] = 0
+    together.eliminate_zeros()
+
+    carts_per_product = np.asarray(baskets.sum(axis=0)).ravel()
+    norms = sparse.diags(1 / np.sqrt(carts_per_product))
+    scores = (norms @ together @ norms).tocsr()
+
+    return top_k(scores, product_ids, product_ids, k)
+
+
+TOKEN = re.compile(r'\b[^\W_]{2,30}\b')
+
+
+def text_digest(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little')
+
+
+def count_terms(texts, vocabulary):
+    """
+    Sparse matrix of term counts, one row per text. New terms are appended to `vocabulary`, a term -> column dict.
+    """
+    data, indices, indptr = [], [], [0]
+    for text in texts:
+        counts = Counter(TOKEN.findall(text.lower()))
+        for term, count in counts.items():
+            indices.append(vocabulary.setdefault(term, len(vocabulary)))
+            data.append(count)
+        indptr.append(len(indices))
+
+    return sparse.csr_matrix((np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), indptr),
+                             shape=(len(indptr) - 1, len(vocabulary)))
+
+
+def tfidf(counts, max_df=0.5):
+    """
+    L2 normalised TF-IDF rows with sublinear term frequencies. Terms in more than `max_df` of the
+    documents are dropped, they only make every product similar to every other one.
+    """
+    documents = max(counts.shape[0], 1)
+    df = np.bincount(counts.indices, minlength=counts.shape[1])
+    idf = np.log((1 + documents) / (1 + df)) + 1
+    idf[df > max_df * documents] = 0
+
+    weights = counts.copy()
+    weights.data = (1 + np.log(weights.data)) * idf[weights.indices]
+    weights.eliminate_zeros()
+
+    norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return (sparse.diags(1 / norms) @ weights).tocsr()
+
+
+def most_similar(weights, product_ids, rows, k=20, block_cells=25_000_000):
+    """
+    Yield (product id, neighbour id, score, rank) for the k most similar products of the products at `rows`.
+    Scores are computed a block of rows at a time, as a dense block of at most `block_cells` floats.
+    """
+    transposed = weights.T.tocsr()
+    block_size = max(1, block_cells // max(len(product_ids), 1))
+
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        scores = (weights[block] @ transposed).toarray()
+        # A product is not its own neighbour
+        scores[np.arange(len(block)), block] = 0
+
+        count = min(k, scores.shape[1])
+        best = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+        for row, product_id in enumerate(product_ids[block].tolist()):
+            for rank, (column, score) in enumerate(zip(best[row].tolist(), best_scores[row].tolist()), start=1):
+                if score <= 0:
+                    break
+                yield product_id, int(product_ids[column]), score, rank
+
+
+def load_index(path):
+    """
+    The stored term counts of every product, or None before the first build.
+    """
+    try:
+        stored = np.load(path, allow_pickle=False)
+    except FileNotFoundError:
+        return None
+
+    vocabulary = {term: column for column, term in enumerate(stored['vocabulary'])}
+    counts = sparse.csr_matrix((stored['data'], stored['indices'], stored['indptr']),
+                               shape=(len(stored['product_ids']), len(vocabulary)))
+    return {
+        'product_ids': stored['product_ids'],
+        'digests': stored['digests'],
+        'counts': counts,
+        'vocabulary': vocabulary,
+        'built_at': datetime.datetime.fromisoformat(str(stored['built_at'])),
+    }
+
+
+def save_index(path, index):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    counts = index['counts']
+    vocabulary = np.array(sorted(index['vocabulary'], key=index['vocabulary'].get), dtype=str)
+
+    # Written next to the previous index and swapped in, a failed build keeps the old one
+    temporary = f'{path}.part.npz'
+    np.savez_compressed(temporary, product_ids=index['product_ids'], digests=index['digests'], data=counts.data,
+                        indices=counts.indices, indptr=counts.indptr, vocabulary=vocabulary,
+                        built_at=np.array(index['built_at'].isoformat()))
+    os.replace(temporary, path)
+
+
+@transaction.atomic
+def replace_neighbours(kind, rows, product_ids=None, batch_size=5000):
+    """
+    Store (product id, neighbour id, score, rank) rows as the neighbours of this kind, replacing the previous
+    ones of the given products, or of all products.
+    """
+    previous = ProductNeighbour.objects.filter(kind=kind)
+    if product_ids is not None:
+        previous = previous.filter(product_id__in=product_ids)
+    previous.delete()
+
+    batch = []
+    for product_id, neighbour_id, score, rank in rows:
+        batch.append(ProductNeighbour(product_id=product_id, neighbour_id=neighbour_id, kind=kind,
+                                      score=score, rank=rank))
+        if len(batch) == batch_size:
+            ProductNeighbour.objects.bulk_create(batch)
+            batch = []
+    ProductNeighbour.objects.bulk_create(batch)
+
+    bump_generation(Products)
@@ -1,10 +1,19 @@
+import os.path
+from decimal import Decimal
+
 from rest_framework import serializers
 
+from apps.common.serializers import ImageVariantsField, SparseFieldsMixin
+from apps.products.bulk import FORMATS
 
-from apps.products.models import Products, ProductCategory, ProductReview, ProductAttachments
+from apps.products.models import Products, ProductCategory, ProductReview, ProductAttachments, UploadSession, \
+    ProductNeighbour
+from config import settings
 
 
 class ProductAttachmentsSerializer(serializers.ModelSerializer):
+    variants = ImageVariantsField(source='attachment')
+
     class Meta:
         model = ProductAttachments
         fields = [
@@ -12,6 +21,7 @@ class ProductAttachmentsSerializer(serializers.ModelSerializer):
             'created_at',
             'updated_at',
             'attachment',
+            'variants',
             'product',
         ]
 
@@ -22,22 +32,109 @@ class ProductAttachmentsSerializer(serializers.ModelSerializer):
         ]
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     attachments = ProductAttachmentsSerializer(many=True, read_only=True)
 
     class Meta:
         model = Products
-        fields = '__all__'
+        exclude = ['search_vector']
+        expandable_fields = {'category': 'apps.products.serializers.ProductCategorySerializer'}
+        prefetch_fields = {'attachments': ['attachments']}
+
+        read_only_fields = [
+            'id',
+            'created_at',
+            'updated_at',
+            'deleted_at',
+            'sold',
+            'rating_count',
+            'rating_sum',
+            'rating_avg',
+            'rating_1',
+            'rating_2',
+            'rating_3',
+            'rating_4',
+            'rating_5'
+        ]
+
+
+class ProductListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Used for product lists, leaves out the heavy text fields.
+    """
+    attachments = ProductAttachmentsSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Products
+        fields = [
+            'id',
+            'created_at',
+            'updated_at',
+            'deleted_at',
+            'name',
+            'category',
+            'price',
+            'discount',
+            'effective_price',
+            'sold',
+            'rating_count',
+            'rating_avg',
+            'attachments',
+        ]
+        read_only_fields = fields
+        expandable_fields = ProductSerializer.Meta.expandable_fields
+        prefetch_fields = ProductSerializer.Meta.prefetch_fields
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    checksum = serializers.RegexField(r'^[0-9a-fA-F]{64}$', help_text='SHA-256 of the whole file, hex encoded.')
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id',
+            'created_at',
+            'updated_at',
+            'product',
+            'filename',
+            'size',
+            'checksum',
+            'received',
+            'status',
+            'attachment',
+        ]
 
         read_only_fields = [
             'id',
             'created_at',
             'updated_at',
-            'deleted_at'
+            'received',
+            'status',
+            'attachment',
         ]
 
+    def validate_size(self, value):
+        if not 0 < value <= settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f'Uploads are limited to {settings.UPLOAD_MAX_SIZE} bytes.')
+        return value
+
+
+class ProductNeighbourSerializer(serializers.ModelSerializer):
+    product = ProductListSerializer(source='neighbour', read_only=True)
+
+    class Meta:
+        model = ProductNeighbour
+        fields = [
+            'product',
+            'score',
+            'rank',
+        ]
+        read_only_fields = fields
+
 
 class ProductCategorySerializer(serializers.ModelSerializer):
+    img_variants = ImageVariantsField(source='img')
+
     class Meta:
         model = ProductCategory
         fields = '__all__'
@@ -45,14 +142,21 @@ class ProductCategorySerializer(serializers.ModelSerializer):
         read_only_fields = [
             'id',
             'created_at',
-            'updated_at'
+            'updated_at',
+            'path'
         ]
 
+    def validate_child_of(self, value):
+        if value and self.instance and value.path.startswith(self.instance.path):
+            raise serializers.ValidationError('A category can not be moved under itself or its subcategories.')
+        return value
+
 
-class ProductReviewSerializer(serializers.ModelSerializer):
+class ProductReviewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = ProductReview
         fields = '__all__'
+        expandable_fields = {'product': 'apps.products.serializers.ProductListSerializer'}
 
         read_only_fields = [
             'id',
@@ -60,3 +164,46 @@ class ProductReviewSerializer(serializers.ModelSerializer):
             'updated_at',
             'user',
         ]
+
+
+class ProductSuggestionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Products
+        fields = [
+            'id',
+            'name'
+        ]
+
+
+class ProductSuggestQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(min_length=2, max_length=64, trim_whitespace=True)
+    limit = serializers.IntegerField(required=False, default=10, min_value=1, max_value=25)
+
+
+class ProductIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), min_length=1, max_length=1000)
+
+
+class BestSellersQuerySerializer(serializers.Serializer):
+    days = serializers.IntegerField(required=False, min_value=1, max_value=365)
+
+
+class ProductFacetsQuerySerializer(serializers.Serializer):
+    facets = serializers.BooleanField(default=False, help_text='Add category and price counts of the filtered products.')
+    price_step = serializers.DecimalField(max_digits=9, decimal_places=2, min_value=Decimal('0.01'), default=100)
+
+
+class ProductImportFileSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    file_format = serializers.ChoiceField(choices=FORMATS, required=False, help_text='Defaults to the file extension.')
+
+    def validate(self, attrs):
+        if 'file_format' not in attrs:
+            attrs['file_format'] = os.path.splitext(attrs['file'].name)[1].lstrip('.').lower()
+            if attrs['file_format'] not in FORMATS:
+                raise serializers.ValidationError({'file_format': 'Can not guess the format from the file name.'})
+        return attrs
+
+
+class ProductExportQuerySerializer(serializers.Serializer):
+    file_format = serializers.ChoiceField(choices=FORMATS, default='csv')
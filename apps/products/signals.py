@@ -0,0 +1,49 @@
+from django.db.models.functions import Substr
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.common.cache import bump_generation_receiver
+from apps.common.images import enqueue_variants
+from apps.products.models import ProductCategory, Products, ProductAttachments, ProductReview
+
+for model in (Products, ProductCategory, ProductAttachments):
+    post_save.connect(bump_generation_receiver, sender=model, dispatch_uid=f'bump_generation_save_{model.__name__}')
+    post_delete.connect(bump_generation_receiver, sender=model, dispatch_uid=f'bump_generation_delete_{model.__name__}')
+
+
+@receiver(post_delete, sender=ProductCategory)
+def reroot_category_descendants(sender, instance, *args, **kwargs):
+    # The children are detached by SET_NULL, drop the removed part of their paths
+    if instance.path:
+        ProductCategory.objects.filter(path__startswith=instance.path).update(
+            path=Substr('path', len(instance.path) + 1))
+
+
+@receiver(post_save, sender=ProductReview)
+def add_review_rating(sender, instance, created, *args, **kwargs):
+    product_id, rating = getattr(instance, 'stored_rating', (None, None))
+
+    if created or product_id is None:
+        Products.update_rating(instance.product_id, added=instance.rating)
+    elif product_id == instance.product_id:
+        Products.update_rating(product_id, added=instance.rating, removed=rating)
+    else:
+        Products.update_rating(product_id, removed=rating)
+        Products.update_rating(instance.product_id, added=instance.rating)
+
+    instance.stored_rating = (instance.product_id, instance.rating)
+
+
+@receiver(post_delete, sender=ProductReview)
+def remove_review_rating(sender, instance, *args, **kwargs):
+    Products.update_rating(instance.product_id, removed=instance.rating)
+
+
+@receiver(post_save, sender=ProductAttachments)
+def create_attachment_variants(sender, instance, *args, **kwargs):
+    enqueue_variants(instance.attachment)
+
+
+@receiver(post_save, sender=ProductCategory)
+def create_category_img_variants(sender, instance, *args, **kwargs):
+    enqueue_variants(instance.img)
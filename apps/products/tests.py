@@ -1,14 +1,29 @@
+import datetime
+import hashlib
+import io
 import os.path
 import shutil
+import tempfile
+from concurrent.futures import Future
+from decimal import Decimal
+from unittest import mock
 
 from django.core.files.uploadedfile import SimpleUploadedFile, File
+from django.core.management import call_command
 
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from apps.products.models import Products, ProductAttachments, ProductReview, ProductCategory
+from apps.common.cache import get_generations
+from apps.common.images import generate_variants, variants_done
+from apps.orders.models import Order, Cart
+from apps.products.models import Products, ProductAttachments, ProductReview, ProductCategory, ProductSales, \
+    UploadSession
+from apps.products.uploads import part_path
 from apps.users.models import User
 
 from config.settings import MEDIA_FOR_TESTING_ROOT, MEDIA_ROOT
@@ -28,6 +43,8 @@ class TestProduct(TestCase):
 
         self.product1 = Products.objects.create(name='test1', price=3, discount=0)
         self.product2 = Products.objects.create(name='test2', price=4, discount=0)
+        # Like a live catalog, every cached model already has a generation
+        get_generations((Products, ProductAttachments, ProductCategory))
 
     def test_user_get(self):
         self.client.force_authenticate(self.user)
@@ -36,6 +53,290 @@ class TestProduct(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_user_get_constant_queries(self):
+        self.client.force_authenticate(self.user)
+
+        for product in Products.objects.all():
+            product.attachments.create(attachment='product/attachments/test.jpg')
+
+        # Generations, count, page and attachments
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('product-list'))
+
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertNotIn('details', response.data['results'][0])
+        self.assertEqual(len(response.data['results'][0]['attachments']), 1)
+
+        for index in range(10):
+            product = Products.objects.create(name=f'bulk{index}', price=1, discount=0)
+            product.attachments.create(attachment='product/attachments/test.jpg')
+
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('product-list'))
+
+        self.assertEqual(len(response.data['results']), 12)
+
+    def test_user_get_cached(self):
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(reverse('product-list'), {'category': ''})
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        # Only the generations
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('product-list'), {'category': ''})
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['count'], 2)
+
+        self.product1.name = 'renamed'
+        self.product1.save()
+
+        response = self.client.get(reverse('product-list'), {'category': ''})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][1]['name'], 'renamed')
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('cache-stats'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreaterEqual(response.data['hits'], 1)
+
+    def test_user_get_not_modified(self):
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(reverse('product-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        # A soft deleted product would not move the newest updated_at of the list
+        self.assertNotIn('Last-Modified', response)
+
+        response = self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(reverse('product-detail', kwargs={'pk': self.product1.id}),
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.product1.name = 'renamed'
+        self.product1.save()
+
+        response = self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_user_get_not_modified_after_command(self):
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(reverse('product-list'))
+        etag = response['ETag']
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        # The command runs in its own process, with a cache of its own
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                                   'LOCATION': 'command'}}):
+            call_command('rebuild_ratings', stdout=io.StringIO())
+
+        response = self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_user_get_expanded_not_modified(self):
+        self.client.force_authenticate(self.user)
+        category = ProductCategory.objects.create(name='phones')
+        self.product1.category = category
+        self.product1.save()
+        url = reverse('product-detail', kwargs={'pk': self.product1.id})
+
+        etag = self.client.get(url, {'expand': 'category'})['ETag']
+        response = self.client.get(url, {'expand': 'category'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        category.name = 'smartphones'
+        category.save()
+
+        response = self.client.get(url, {'expand': 'category'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['category']['name'], 'smartphones')
+
+    def test_user_get_not_modified_constant_queries(self):
+        self.client.force_authenticate(self.user)
+        Products.objects.bulk_create([Products(name=f'bulk{index}', price=1, discount=0) for index in range(50)])
+
+        etag = self.client.get(reverse('product-list'), {'paginator': 'cursor'})['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('product-list'), {'paginator': 'cursor'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.product1.delete()
+
+        response = self.client.get(reverse('product-list'), {'paginator': 'cursor'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_user_get_sparse_fields(self):
+        self.client.force_authenticate(self.user)
+        self.product1.attachments.create(attachment='product/attachments/test.jpg')
+
+        # Generations, count and page, without the attachments
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('product-list'), {'fields': 'id,name,price'})
+
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'price'})
+
+        category = ProductCategory.objects.create(name='phones')
+        Products.objects.filter(id=self.product1.id).update(category=category)
+
+        response = self.client.get(reverse('product-detail', kwargs={'pk': self.product1.id}),
+                                   {'fields': 'id,category', 'expand': 'category'})
+
+        self.assertEqual(set(response.data), {'id', 'category'})
+        self.assertEqual(response.data['category']['name'], 'phones')
+
+    def test_user_get_price_and_discount_filtered(self):
+        self.client.force_authenticate(self.user)
+        Products.objects.create(name='discounted', price=150, discount=10)
+
+        response = self.client.get(reverse('product-list'), {'price_min': 3.5, 'price_max': 200})
+        self.assertEqual(response.data['count'], 2)
+
+        response = self.client.get(reverse('product-list'), {'has_discount': 'true'})
+        self.assertEqual([product['name'] for product in response.data['results']], ['discounted'])
+
+        response = self.client.get(reverse('product-list'), {'discount_max': 5})
+        self.assertEqual(response.data['count'], 2)
+
+    def test_user_get_ordered_by_effective_price(self):
+        self.client.force_authenticate(self.user)
+        product = Products.objects.create(name='discounted', price=10, discount=75)
+        self.assertEqual(product.effective_price, Decimal('2.50'))
+
+        # Bulk writes skip save(), the trigger keeps the column in sync
+        Products.objects.filter(id=self.product2.id).update(discount=50)
+
+        response = self.client.get(reverse('product-list'), {'ordering': 'effective_price'})
+        self.assertEqual([item['name'] for item in response.data['results']], ['test2', 'discounted', 'test1'])
+        self.assertEqual(response.data['results'][0]['effective_price'], '2.00')
+
+        response = self.client.get(reverse('product-list'), {'effective_price_min': 2.5, 'effective_price_max': 3})
+        self.assertEqual(response.data['count'], 2)
+
+    def test_user_get_facets(self):
+        self.client.force_authenticate(self.user)
+        category = ProductCategory.objects.create(name='phones')
+        Products.objects.create(name='phone', price=150, discount=0, category=category)
+
+        response = self.client.get(reverse('product-list'), {'category': category.id, 'facets': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['facets']['categories'], [
+            {'category': None, 'count': 2}, {'category': category.id, 'count': 1}])
+        self.assertEqual([(bucket['from'], bucket['count']) for bucket in response.data['facets']['prices']],
+                         [(100, 1)])
+
+        response = self.client.get(reverse('product-list'))
+        self.assertNotIn('facets', response.data)
+
+    def test_user_get_cursor_paginated(self):
+        self.client.force_authenticate(self.user)
+
+        for index in range(25):
+            Products.objects.create(name=f'bulk{index}', price=1, discount=0)
+
+        response = self.client.get(reverse('product-list'), {'paginator': 'cursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 20)
+
+        response = self.client.get(response.data['next'])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 7)
+        self.assertEqual(response.data['results'][-1]['id'], self.product1.id)
+        self.assertIsNone(response.data['next'])
+
+    def test_user_get_cursor_paginated_ordering(self):
+        self.client.force_authenticate(self.user)
+        Products.objects.all().delete()
+
+        # Newer products are not the cheaper ones, and some prices are shared across the page break
+        for index in range(25):
+            Products.objects.create(name=f'priced{index}', price=(index * 7) % 12, discount=0)
+
+        response = self.client.get(reverse('product-list'), {'paginator': 'cursor', 'ordering': 'effective_price'})
+        ids = [item['id'] for item in response.data['results']]
+
+        response = self.client.get(response.data['next'])
+        ids += [item['id'] for item in response.data['results']]
+
+        expected = Products.objects.order_by('effective_price', 'id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+
+        response = self.client.get(reverse('product-list'), {'paginator': 'cursor', 'search': 'priced3'})
+        self.assertEqual([item['name'] for item in response.data['results']], ['priced3'])
+
+    def test_user_get_cursor_paginated_ties(self):
+        self.client.force_authenticate(self.user)
+        Products.objects.all().delete()
+        Products.objects.bulk_create([Products(name=f'same{index}', price=5, discount=0) for index in range(45)])
+        expected = list(Products.objects.order_by('-effective_price', '-id').values_list('id', flat=True))
+
+        response = self.client.get(reverse('product-list'), {'paginator': 'cursor', 'ordering': '-effective_price'})
+        pages = [[item['id'] for item in response.data['results']]]
+        while response.data['next']:
+            # The position is the (effective_price, id) pair of the last row, never an offset
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(response.data['next'])
+            self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+            pages.append([item['id'] for item in response.data['results']])
+
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        self.assertEqual(sum(pages, []), expected)
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([item['id'] for item in response.data['results']], pages[1])
+
+    def test_user_search(self):
+        self.client.force_authenticate(self.user)
+
+        category = ProductCategory.objects.create(name='phones')
+        in_details = Products.objects.create(
+            name='Case', details='Leather case for a phone', price=1, discount=0, category=category)
+        in_name = Products.objects.create(name='Phone X', price=9, discount=0, category=category)
+        Products.objects.create(name='Phone Y', price=9, discount=0)
+
+        response = self.client.get(reverse('product-list'), {'search': 'phones', 'category': category.id})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['results']], [in_name.id, in_details.id])
+
+        in_details.details = 'Leather case'
+        in_details.save()
+
+        response = self.client.get(reverse('product-list'), {'search': 'phone', 'category': category.id})
+
+        self.assertEqual([item['id'] for item in response.data['results']], [in_name.id])
+
+    def test_user_suggest(self):
+        self.client.force_authenticate(self.user)
+
+        phone = Products.objects.create(name='Smart phone', price=1, discount=0)
+        Products.objects.create(name='Headphones', price=1, discount=0)
+
+        response = self.client.get(reverse('product-suggest'), {'q': 'pho', 'limit': 5})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{'id': phone.id, 'name': 'Smart phone'}])
+
+    def test_user_suggest_short_query_negative(self):
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(reverse('product-suggest'), {'q': 'p'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_user_get_bestsellers(self):
         self.client.force_authenticate(self.user)
 
@@ -52,6 +353,42 @@ class TestProduct(TestCase):
         response = self.client.get(reverse('product-best-sellers'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    @mock.patch('apps.common.views.get_event_from_request')
+    def test_user_get_bestsellers_after_payment(self, mock_get_event_from_request):
+        self.client.force_authenticate(self.user)
+
+        cart = self.user.get_user_cart(create_if_none=True)
+        cart.add_item(self.product1, 1)
+        cart.add_item(self.product2, 3)
+        order = Order.objects.create(user=self.user, cart=cart)
+
+        mock_get_event_from_request.return_value = {
+            'type': 'payment_intent.succeeded',
+            'data': {'object': {'metadata': {'order_id': order.id, 'user_id': self.user.id}}}
+        }
+        self.client.post(reverse('webhooks-stripe'))
+        # A repeated event must not count the order twice
+        self.client.post(reverse('webhooks-stripe'))
+
+        response = self.client.get(reverse('product-best-sellers'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['results']], [self.product2.id, self.product1.id])
+        self.assertEqual(response.data['results'][0]['sold'], 3)
+        self.assertEqual(ProductSales.objects.get(product=self.product2).sold, 3)
+
+        response = self.client.get(reverse('product-best-sellers'), {'days': 7})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+
+    def test_user_get_bestsellers_invalid_days_negative(self):
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(reverse('product-best-sellers'), {'days': 0})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_user_post_negative(self):
         self.client.force_authenticate(self.user)
 
@@ -86,6 +423,88 @@ class TestProduct(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_admin_import(self):
+        self.client.force_authenticate(self.admin)
+
+        content = (
+            'id,name,category,price,discount,specs\n'
+            f'{self.product1.id},renamed,,5.50,10,\n'
+            ',new product,,2,0,Promo\n'
+            ',bad discount,,2,120,\n'
+            '999999,unknown,,2,0,\n'
+        )
+        data = {'file': SimpleUploadedFile('products.csv', content.encode(), content_type='text/csv')}
+
+        response = self.client.post(reverse('product-import-products'), data)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['failed']), (1, 1, 2))
+        self.assertEqual([error['line'] for error in response.data['errors']], [4, 5])
+        self.product1.refresh_from_db()
+        self.assertEqual((self.product1.name, self.product1.discount), ('renamed', 10))
+        self.assertTrue(Products.objects.filter(name='new product', specs='Promo').exists())
+
+    def test_admin_import_csv_with_bom(self):
+        self.client.force_authenticate(self.admin)
+
+        content = f'id,name,price\n{self.product1.id},renamed,5.50\n'
+        data = {'file': SimpleUploadedFile('products.csv', content.encode('utf-8-sig'), content_type='text/csv')}
+
+        response = self.client.post(reverse('product-import-products'), data)
+
+        self.assertEqual((response.data['created'], response.data['updated']), (0, 1))
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.name, 'renamed')
+
+    def test_admin_import_partial_columns(self):
+        self.client.force_authenticate(self.admin)
+        category = ProductCategory.objects.create(name='phones')
+        Products.objects.filter(id__in=[self.product1.id, self.product2.id]).update(
+            category=category, details='Details', specs='Specs', discount=10)
+
+        content = (
+            f'{{"id": {self.product1.id}, "name": "renamed", "price": "5.50"}}\n'
+            f'{{"id": {self.product2.id}, "name": "test2", "price": "4", "category": null, "discount": 0}}\n'
+        )
+        data = {'file': SimpleUploadedFile('products.jsonl', content.encode())}
+
+        response = self.client.post(reverse('product-import-products'), data)
+
+        self.assertEqual(response.data['updated'], 2)
+        product1 = Products.objects.get(id=self.product1.id)
+        self.assertEqual((product1.name, product1.price, product1.category, product1.details, product1.specs,
+                          product1.discount), ('renamed', Decimal('5.50'), category, 'Details', 'Specs', 10))
+        product2 = Products.objects.get(id=self.product2.id)
+        self.assertEqual((product2.category, product2.details, product2.discount), (None, 'Details', 0))
+
+    def test_admin_import_jsonl(self):
+        self.client.force_authenticate(self.admin)
+
+        content = '{"name": "json product", "price": "1.25"}\nnot json\n'
+        data = {'file': SimpleUploadedFile('products.jsonl', content.encode())}
+
+        response = self.client.post(reverse('product-import-products'), data)
+
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 1))
+
+    def test_admin_export(self):
+        self.client.force_authenticate(self.admin)
+
+        response = self.client.get(reverse('product-export'), {'file_format': 'csv'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,name,category,details,price,discount,specs')
+        self.assertEqual(lines[1], f'{self.product1.id},test1,,,3.00,0,')
+        self.assertEqual(len(lines), 3)
+
+    def test_user_export_negative(self):
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(reverse('product-export'))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
     def test_admin_post_invalid_discount(self):
         self.client.force_authenticate(self.admin)
 
@@ -116,6 +535,125 @@ class TestProduct(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+    def test_user_get_without_deleted(self):
+        self.client.force_authenticate(self.user)
+
+        self.product1.delete()
+
+        response = self.client.get(reverse('product-list'), {'include_deleted': 'true'})
+        self.assertEqual([item['id'] for item in response.data['results']], [self.product2.id])
+
+        response = self.client.get(reverse('product-detail', kwargs={'pk': self.product1.id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_admin_get_deleted_and_restore(self):
+        self.client.force_authenticate(self.admin)
+
+        self.product1.delete()
+
+        response = self.client.get(reverse('product-list'), {'include_deleted': 'true'})
+        self.assertEqual(response.data['count'], 2)
+
+        response = self.client.post(reverse('product-restore', kwargs={'pk': self.product1.id}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['deleted_at'])
+        self.assertEqual(Products.objects.count(), 2)
+
+    def test_user_get_batch(self):
+        self.client.force_authenticate(self.user)
+        self.product1.attachments.create(attachment='product/attachments/test.jpg')
+        deleted = Products.objects.create(name='deleted', price=1, discount=0)
+        deleted.delete()
+
+        ids = f'{self.product1.id},{deleted.id},{self.product2.id},999999'
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('product-batch'), {'ids': ids})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([product['id'] for product in response.data['results']], [self.product1.id, self.product2.id])
+        self.assertEqual(len(response.data['results'][0]['attachments']), 1)
+        self.assertEqual(response.data['missing'], [999999])
+        self.assertEqual(response.data['deleted'], [deleted.id])
+
+        response = self.client.post(reverse('product-batch'), {'ids': [self.product2.id, self.product1.id]},
+                                    format='json')
+        self.assertEqual([product['id'] for product in response.data['results']], [self.product2.id, self.product1.id])
+
+        response = self.client.get(reverse('product-batch'), {'ids': 'a,b'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_user_get_bought_together(self):
+        self.client.force_authenticate(self.user)
+        product3 = Products.objects.create(name='test3', price=5, discount=0)
+
+        for products, is_archived in (((self.product1, self.product2), True),
+                                      ((self.product1, self.product2, product3), True),
+                                      ((self.product1, product3), False)):
+            cart = Cart.objects.create(user=self.user, is_archived=is_archived)
+            for product in products:
+                cart.items.create(product=product)
+
+        call_command('build_bought_together', stdout=open(os.devnull, 'w'))
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('product-bought-together', kwargs={'pk': self.product1.id}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['product']['id'] for item in response.data], [self.product2.id])
+        self.assertAlmostEqual(response.data[0]['score'], 1.0, places=5)
+
+        self.product2.delete()
+
+        response = self.client.get(reverse('product-bought-together', kwargs={'pk': self.product1.id}))
+        self.assertEqual(response.data, [])
+
+    def test_user_get_similar(self):
+        self.client.force_authenticate(self.user)
+        phone = Products.objects.create(name='Android phone', details='Black phone with a large screen', price=1,
+                                        discount=0)
+        other_phone = Products.objects.create(name='Phone', details='Large screen phone', price=1, discount=0)
+        Products.objects.create(name='Kettle', details='Electric kettle', price=1, discount=0)
+
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch('config.settings.SIMILAR_PRODUCTS_INDEX', os.path.join(directory, 'index.npz')):
+            call_command('build_similar_products', stdout=open(os.devnull, 'w'))
+
+            response = self.client.get(reverse('product-similar', kwargs={'pk': phone.id}))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data[0]['product']['id'], other_phone.id)
+
+            # Only the new product and the products close to it are rebuilt
+            tablet = Products.objects.create(name='Android tablet', details='Black tablet with a large screen',
+                                             price=1, discount=0)
+            output = io.StringIO()
+            call_command('build_similar_products', stdout=output)
+            self.assertIn('1 texts changed', output.getvalue())
+
+            response = self.client.get(reverse('product-similar', kwargs={'pk': tablet.id}))
+            self.assertEqual(response.data[0]['product']['id'], phone.id)
+
+            response = self.client.get(reverse('product-similar', kwargs={'pk': phone.id}))
+            self.assertEqual([item['product']['id'] for item in response.data], [other_phone.id, tablet.id])
+
+    def test_admin_bulk_delete_and_restore(self):
+        self.client.force_authenticate(self.admin)
+
+        data = {'ids': [self.product1.id, self.product2.id]}
+
+        # The update and the generation bump
+        with self.assertNumQueries(2):
+            response = self.client.post(reverse('product-bulk-delete'), data, format='json')
+
+        self.assertEqual(response.data['deleted'], 2)
+        self.assertEqual(Products.objects.count(), 0)
+        self.assertEqual(Products.all_objects.count(), 2)
+
+        response = self.client.post(reverse('product-bulk-restore'), data, format='json')
+
+        self.assertEqual(response.data['restored'], 2)
+        self.assertEqual(Products.objects.count(), 2)
+
     def test_admin_update(self):
         self.client.force_authenticate(self.admin)
 
@@ -157,6 +695,36 @@ class TestProductAttachments(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_user_get_variants(self):
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(reverse('attachments-detail', kwargs={'pk': self.attachment.id}))
+        self.assertIsNone(response.data['variants']['thumbnail'])
+
+        future = Future()
+        future.set_result(generate_variants(self.attachment.attachment.path))
+        # The callback closes the connection of its thread, here the test's
+        with mock.patch('apps.common.images.connection'):
+            variants_done(future, ProductAttachments, self.attachment.id, 'attachment', self.attachment.attachment.name)
+
+        # Built from the row, without asking the storage
+        with mock.patch('django.core.files.storage.default_storage.exists') as exists:
+            response = self.client.get(reverse('attachments-detail', kwargs={'pk': self.attachment.id}))
+        exists.assert_not_called()
+        self.assertTrue(response.data['variants']['thumbnail'].endswith('.thumbnail.jpg'))
+        self.assertTrue(response.data['variants']['webp'].endswith('.webp'))
+
+    def test_user_get_variants_failed(self):
+        self.client.force_authenticate(self.user)
+
+        future = Future()
+        future.set_exception(OSError('cannot identify image file'))
+        with self.assertLogs('apps.common.images', level='ERROR'):
+            variants_done(future, ProductAttachments, self.attachment.id, 'attachment', self.attachment.attachment.name)
+
+        response = self.client.get(reverse('attachments-detail', kwargs={'pk': self.attachment.id}))
+        self.assertIsNone(response.data['variants']['thumbnail'])
+
     def test_user_get_filtered_product(self):
         self.client.force_authenticate(self.user)
 
@@ -213,6 +781,93 @@ class TestProductAttachments(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_admin_chunked_upload(self):
+        self.client.force_authenticate(self.admin)
+        content = open(self.img_path, 'rb').read()
+        half = len(content) // 2
+
+        response = self.client.post(reverse('upload-list'), {
+            'product': self.product1.id,
+            'filename': 'chunked.jpg',
+            'size': len(content),
+            'checksum': hashlib.sha256(content).hexdigest(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        url = reverse('upload-detail', kwargs={'pk': response.data['id']})
+        finalize_url = reverse('upload-finalize', kwargs={'pk': response.data['id']})
+
+        response = self.client.put(url, content[:half], content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE=f'bytes 0-{half - 1}/{len(content)}',
+                                   HTTP_X_CHUNK_CHECKSUM=hashlib.sha256(content[:half]).hexdigest())
+        self.assertEqual(response.data['received'], half)
+
+        # A gap after the received bytes
+        response = self.client.put(url, content[half + 1:], content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE=f'bytes {half + 1}-{len(content) - 1}/{len(content)}')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(finalize_url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.put(url, content[half:], content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE=f'bytes {half}-{len(content) - 1}/{len(content)}')
+        self.assertEqual(response.data['received'], len(content))
+
+        response = self.client.post(finalize_url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'complete')
+        attachment = ProductAttachments.objects.get(id=response.data['attachment'])
+        self.assertEqual(attachment.product, self.product1)
+        self.assertEqual(attachment.attachment.read(), content)
+
+    def test_admin_chunked_upload_bad_checksum(self):
+        self.client.force_authenticate(self.admin)
+        content = open(self.img_path, 'rb').read()
+
+        response = self.client.post(reverse('upload-list'), {
+            'product': self.product1.id, 'filename': 'chunked.jpg', 'size': len(content), 'checksum': '0' * 64})
+        url = reverse('upload-detail', kwargs={'pk': response.data['id']})
+        finalize_url = reverse('upload-finalize', kwargs={'pk': response.data['id']})
+
+        response = self.client.put(url, content, content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE=f'bytes 0-{len(content) - 1}/{len(content)}',
+                                   HTTP_X_CHUNK_CHECKSUM='0' * 64)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url).data['received'], 0)
+
+        self.client.put(url, content, content_type='application/octet-stream',
+                        HTTP_CONTENT_RANGE=f'bytes 0-{len(content) - 1}/{len(content)}')
+        response = self.client.post(finalize_url)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url).data['received'], 0)
+
+    def test_admin_chunked_upload_expired(self):
+        self.client.force_authenticate(self.admin)
+        content = open(self.img_path, 'rb').read()
+
+        response = self.client.post(reverse('upload-list'), {
+            'product': self.product1.id, 'filename': 'chunked.jpg', 'size': len(content), 'checksum': '0' * 64})
+        url = reverse('upload-detail', kwargs={'pk': response.data['id']})
+        self.client.put(url, content[:10], content_type='application/octet-stream',
+                        HTTP_CONTENT_RANGE=f'bytes 0-9/{len(content)}')
+
+        session = UploadSession.objects.get(id=response.data['id'])
+        path = part_path(session)
+        self.assertTrue(os.path.exists(path))
+        UploadSession.objects.filter(id=session.id).update(
+            updated_at=datetime.datetime.now() - datetime.timedelta(days=2))
+
+        response = self.client.put(url, content[10:], content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE=f'bytes 10-{len(content) - 1}/{len(content)}')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        call_command('expire_uploads', stdout=io.StringIO())
+
+        self.assertFalse(UploadSession.objects.filter(id=session.id).exists())
+        self.assertFalse(os.path.exists(path))
+
     def test_admin_update(self):
         self.client.force_authenticate(self.admin)
 
@@ -257,6 +912,54 @@ class TestProductCategory(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_user_get_tree(self):
+        self.client.force_authenticate(self.user)
+
+        child = ProductCategory.objects.create(name='child', child_of=self.category)
+        ProductCategory.objects.create(name='grandchild', child_of=child)
+
+        response = self.client.get(reverse('category-tree'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['children'][0]['children'][0]['name'], 'grandchild')
+
+    def test_user_get_products_in_tree(self):
+        self.client.force_authenticate(self.user)
+
+        child = ProductCategory.objects.create(name='child', child_of=self.category)
+        grandchild = ProductCategory.objects.create(name='grandchild', child_of=child)
+        other = ProductCategory.objects.create(name='other')
+        product = Products.objects.create(name='nested', price=1, discount=0, category=grandchild)
+        Products.objects.create(name='outside', price=1, discount=0, category=other)
+
+        response = self.client.get(reverse('product-list'), {'category_tree': self.category.id})
+
+        self.assertEqual([item['id'] for item in response.data['results']], [product.id])
+
+        child.child_of = other
+        child.save()
+
+        response = self.client.get(reverse('product-list'), {'category_tree': self.category.id})
+        self.assertEqual(response.data['count'], 0)
+
+        response = self.client.get(reverse('product-list'), {'category_tree': other.id})
+        self.assertEqual(response.data['count'], 2)
+
+        other.delete()
+        grandchild.refresh_from_db()
+        self.assertEqual(grandchild.path, f'{child.id}/{grandchild.id}/')
+
+    def test_admin_move_under_descendant_negative(self):
+        self.client.force_authenticate(self.admin)
+
+        child = ProductCategory.objects.create(name='child', child_of=self.category)
+
+        response = self.client.patch(
+            reverse('category-detail', kwargs={'pk': self.category.id}), data={'child_of': child.id})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_user_post_negative(self):
         self.client.force_authenticate(self.user)
 
@@ -340,6 +1043,14 @@ class TestProductReview(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_user_get_expanded_product(self):
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(reverse('review-list'), {'fields': 'id,rating,product', 'expand': 'product'})
+
+        self.assertEqual(set(response.data['results'][0]), {'id', 'rating', 'product'})
+        self.assertEqual(response.data['results'][0]['product']['name'], 'test1')
+
     def test_user_post(self):
         self.client.force_authenticate(self.user)
 
@@ -373,6 +1084,59 @@ class TestProductReview(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+    def test_user_review_updates_rating(self):
+        self.client.force_authenticate(self.user2)
+
+        response = self.client.post(reverse('review-list'), data={'product': self.product1.id, 'rating': 5})
+        self.product1.refresh_from_db()
+
+        self.assertEqual((self.product1.rating_count, self.product1.rating_sum), (2, 8))
+        self.assertEqual(self.product1.rating_5, 1)
+
+        self.client.patch(reverse('review-detail', kwargs={'pk': response.data['id']}), data={'rating': 1})
+        self.product1.refresh_from_db()
+
+        self.assertEqual((self.product1.rating_count, self.product1.rating_sum), (2, 4))
+        self.assertEqual((self.product1.rating_1, self.product1.rating_5), (1, 0))
+
+        self.client.delete(reverse('review-detail', kwargs={'pk': response.data['id']}))
+        self.product1.refresh_from_db()
+
+        self.assertEqual((self.product1.rating_count, self.product1.rating_sum), (1, 3))
+        self.assertEqual(str(self.product1.rating_avg), '3.00')
+
+        self.review.delete()
+        self.product1.refresh_from_db()
+
+        self.assertEqual((self.product1.rating_count, self.product1.rating_avg), (0, 0))
+
+    def test_user_order_and_filter_by_rating(self):
+        self.client.force_authenticate(self.user)
+
+        product2 = Products.objects.create(name='test2', price=3, discount=0)
+        for rating in (4, 5):
+            self.client.post(reverse('review-list'), data={'product': product2.id, 'rating': rating})
+
+        response = self.client.get(reverse('product-list'), {'ordering': '-rating'})
+
+        self.assertEqual([item['id'] for item in response.data['results']], [product2.id, self.product1.id])
+        self.assertEqual(response.data['results'][0]['rating_avg'], '4.50')
+
+        response = self.client.get(reverse('product-list'), {'rating_min': 4})
+
+        self.assertEqual([item['id'] for item in response.data['results']], [product2.id])
+
+    def test_rebuild_ratings_command(self):
+        ProductReview.objects.create(user=self.user2, rating=4, product=self.product1)
+        Products.objects.update(rating_count=0, rating_sum=0)
+
+        call_command('rebuild_ratings', stdout=open(os.devnull, 'w'))
+        self.product1.refresh_from_db()
+
+        self.assertEqual((self.product1.rating_count, self.product1.rating_sum), (2, 7))
+        self.assertEqual(str(self.product1.rating_avg), '3.50')
+        self.assertEqual((self.product1.rating_3, self.product1.rating_4), (1, 1))
+
     def test_user_update_foreign_review_negative(self):
         self.client.force_authenticate(self.user2)
 
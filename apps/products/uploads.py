@@ -0,0 +1,160 @@
+import datetime
+import hashlib
+import os
+import re
+
+from PIL import Image
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.text import get_valid_filename
+from rest_framework.exceptions import ValidationError
+
+from apps.products.models import UploadSession, ProductAttachments
+from config import settings
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+BLOCK_SIZE = 64 * 1024
+
+
+def part_path(session):
+    return default_storage.path(os.path.join('uploads', f'{session.id}.part'))
+
+
+def expiry_cutoff():
+    return datetime.datetime.now() - datetime.timedelta(hours=settings.UPLOAD_SESSION_MAX_AGE_HOURS)
+
+
+def parse_content_range(header):
+    """
+    (first byte, last byte, total size) from a `Content-Range: bytes 0-1023/4096` header.
+    """
+    match = CONTENT_RANGE.match(header or '')
+    if not match:
+        raise ValidationError({'content_range': 'Expected a "bytes <first>-<last>/<size>" header.'})
+
+    start, end, total = map(int, match.groups())
+    if end < start:
+        raise ValidationError({'content_range': 'The last byte is before the first byte.'})
+    if end - start + 1 > settings.UPLOAD_CHUNK_MAX_SIZE:
+        raise ValidationError({'content_range': f'Chunks are limited to {settings.UPLOAD_CHUNK_MAX_SIZE} bytes.'})
+    return start, end, total
+
+
+def lock_open_session(session, start):
+    """
+    Lock the session row and check that a chunk starting at `start` may be written, in the caller's transaction.
+    """
+    session = UploadSession.objects.select_for_update().get(id=session.id)
+
+    if session.status != UploadSession.Status.OPEN:
+        raise ValidationError({'status': 'The upload is already finalized.'})
+    if session.updated_at < expiry_cutoff():
+        raise ValidationError({'status': 'The upload expired, start a new one.'})
+    if start > session.received:
+        raise ValidationError({'content_range': f'The next chunk must start at byte {session.received} or before.'})
+    return session
+
+
+def write_chunk(session, stream, content_range, chunk_checksum=None):
+    """
+    Stream one byte range of the request body into the partial file.
+    Ranges may overlap what was received, but not leave a gap after it.
+    The session row is only locked to check the range and to record it, not while the body is read.
+    """
+    start, end, total = parse_content_range(content_range)
+
+    with transaction.atomic():
+        session = lock_open_session(session, start)
+        if total != session.size or end >= session.size:
+            raise ValidationError({'content_range': f'The file size is {session.size} bytes.'})
+
+    path = part_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    digest = hashlib.sha256()
+    remaining = end - start + 1
+    # Opened without truncating, concurrent chunks of the same upload write to the same file
+    with os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT), 'r+b') as part:
+        part.seek(start)
+        while remaining:
+            block = stream.read(min(BLOCK_SIZE, remaining)) if stream else b''
+            if not block:
+                break
+            digest.update(block)
+            part.write(block)
+            remaining -= len(block)
+
+    # Bytes written past `received` are overwritten by the retried chunk
+    if remaining:
+        raise ValidationError({'content_range': f'The body is {remaining} bytes shorter than the range.'})
+    if chunk_checksum and chunk_checksum.lower() != digest.hexdigest():
+        raise ValidationError({'checksum': 'The chunk does not match its checksum.'})
+
+    with transaction.atomic():
+        # Checked again, the upload may have been finalized or reset meanwhile
+        session = lock_open_session(session, start)
+        session.received = max(session.received, end + 1)
+        session.save(update_fields=['received', 'updated_at'])
+    return session
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finalize_upload(session):
+    """
+    Check the assembled file and move it into the product attachments.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(id=session.id)
+
+        if session.status != UploadSession.Status.OPEN:
+            raise ValidationError({'status': 'The upload is already finalized.'})
+        if session.received != session.size:
+            raise ValidationError({'received': f'{session.received} of {session.size} bytes were received.'})
+
+        path = part_path(session)
+        if file_checksum(path) == session.checksum.lower():
+            try:
+                with Image.open(path) as image:
+                    image.verify()
+            except Exception:
+                raise ValidationError({'filename': 'The file is not a valid image.'})
+
+            name = default_storage.get_available_name(
+                os.path.join(ProductAttachments.attachment.field.upload_to, get_valid_filename(session.filename)))
+            os.makedirs(os.path.dirname(default_storage.path(name)), exist_ok=True)
+            os.replace(path, default_storage.path(name))
+
+            session.attachment = ProductAttachments.objects.create(product=session.product, attachment=name)
+            session.status = UploadSession.Status.COMPLETE
+            session.save(update_fields=['attachment', 'status', 'updated_at'])
+            return session
+
+        # Some chunk was corrupted without a chunk checksum to catch it, start over
+        session.received = 0
+        session.save(update_fields=['received', 'updated_at'])
+
+    raise ValidationError({'checksum': 'The file does not match its checksum, upload it again.'})
+
+
+def expire_sessions():
+    """
+    Delete the open uploads without a chunk for UPLOAD_SESSION_MAX_AGE_HOURS, and their partial files.
+    """
+    expired = UploadSession.objects.filter(status=UploadSession.Status.OPEN, updated_at__lt=expiry_cutoff())
+
+    count = 0
+    for session in expired.iterator():
+        try:
+            os.remove(part_path(session))
+        except FileNotFoundError:
+            pass
+        session.delete()
+        count += 1
+    return count
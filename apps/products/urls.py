@@ -1,12 +1,14 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from apps.products.views import ProductReviewViewSet,ProductAttachmentsViewSet, ProductCategoryViewSet, ProductViewSet
+from apps.products.views import ProductReviewViewSet,ProductAttachmentsViewSet, ProductCategoryViewSet, ProductViewSet, \
+    UploadSessionViewSet
 
 router = DefaultRouter()
 
 router.register('product', ProductViewSet, 'product')
 router.register('product-attachments', ProductAttachmentsViewSet, 'attachments')
+router.register('product-upload', UploadSessionViewSet, 'upload')
 router.register('product-review', ProductReviewViewSet, 'review')
 router.register('product-category', ProductCategoryViewSet, 'category')
 
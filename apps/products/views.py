@@ -1,27 +1,105 @@
-from django.db.models import Count
+import datetime
+import re
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import transaction
+from django.db.models import Sum, Q, Max, Count
+from django.http import StreamingHttpResponse
+from drf_util.utils import gt
 from rest_framework.decorators import action
 from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.serializers import Serializer
 from rest_framework.viewsets import ModelViewSet, mixins, GenericViewSet
 
 from apps.products.serializers import ProductSerializer, ProductCategorySerializer, ProductReviewSerializer, \
-    ProductAttachmentsSerializer
-from apps.products.models import Products, ProductReview, ProductCategory, ProductAttachments
+    ProductAttachmentsSerializer, BestSellersQuerySerializer, ProductListSerializer, ProductSuggestQuerySerializer, \
+    ProductSuggestionSerializer, ProductImportFileSerializer, ProductExportQuerySerializer, ProductIdsSerializer, \
+    ProductFacetsQuerySerializer, UploadSessionSerializer, ProductNeighbourSerializer
+from apps.products.bulk import import_products, read_rows, export_products
+from apps.products.filters import ProductFilter
+from apps.products.models import Products, ProductReview, ProductCategory, ProductAttachments, UploadSession, \
+    ProductNeighbour
+from apps.products.uploads import write_chunk, finalize_upload
+from apps.common.cache import CachedResponseMixin, cache_response
+from apps.common.conditional import ConditionalListMixin, ConditionalRetrieveMixin
+from apps.common.pagination import OptionalCursorPagination
 from apps.common.permisions import IsAdmin, IsAdminOrOwner, ReadOnly
+from apps.users.models import User
 
 # Create your views here.
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(ConditionalListMixin, ConditionalRetrieveMixin, CachedResponseMixin, ModelViewSet):
     serializer_class = ProductSerializer
     queryset = Products.objects.all()
     permission_classes = (IsAuthenticated, IsAdmin | ReadOnly)
-    filterset_fields = ('category',)
+    pagination_class = OptionalCursorPagination
+    filterset_class = ProductFilter
+    list_actions = ('list', 'best_sellers')
+    cache_models = (Products, ProductAttachments, ProductCategory)
+
+    def get_queryset(self):
+        qs = self.queryset
+
+        # Soft deleted products are only visible to admins, on request
+        is_admin = gt(self.request.user, 'role') == User.Role.ADMIN
+        if self.action == 'restore' or (is_admin and self.request.query_params.get('include_deleted') == 'true'):
+            qs = Products.all_objects.all()
+
+        qs = qs.prefetch_related('attachments')
+
+        if self.action in self.list_actions:
+            qs = qs.defer('details', 'specs')
+
+        if self.action in ('list', 'retrieve'):
+            qs = self.get_serializer_class().sparse_queryset(qs, self.request)
+
+        return qs
+
+    def get_conditional_aggregates(self):
+        return {
+            **super().get_conditional_aggregates(),
+            'attachments_modified': Max('attachments__updated_at'),
+            'attachments_count': Count('attachments', distinct=True),
+        }
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+
+        if self.action == 'list':
+            serializer = ProductFacetsQuerySerializer(data=self.request.query_params)
+            serializer.is_valid(raise_exception=True)
+
+            if serializer.validated_data['facets']:
+                filterset = self.filterset_class(self.request.query_params, queryset=self.get_queryset(),
+                                                 request=self.request)
+                response.data['facets'] = filterset.get_facets(serializer.validated_data['price_step'])
+
+        return response
+
+    def get_serializer_class(self):
+        if self.action in self.list_actions:
+            return ProductListSerializer
+
+        return self.serializer_class
 
     @action(detail=False, methods=['GET'])
+    @cache_response
     def best_sellers(self, request, *args, **kwargs):
-        queryset = (self.filter_queryset(self.get_queryset())
-                    .exclude(carts__price=None).annotate(sold=Count('carts')).order_by('sold'))
+        serializer = BestSellersQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        days = serializer.validated_data.get('days')
+
+        queryset = self.filter_queryset(self.get_queryset())
+
+        if days:
+            since = datetime.date.today() - datetime.timedelta(days=days - 1)
+            queryset = (queryset.filter(sales__day__gte=since)
+                        .annotate(sold_in_period=Sum('sales__sold')).order_by('-sold_in_period', '-id'))
+        else:
+            queryset = queryset.filter(sold__gt=0).order_by('-sold', '-id')
 
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -30,23 +108,174 @@ class ProductViewSet(ModelViewSet):
 
         return self.get_serializer(queryset, many=True)
 
+    @action(detail=False, methods=['GET'], serializer_class=ProductSuggestionSerializer, pagination_class=None)
+    def suggest(self, request, *args, **kwargs):
+        """
+        Product names for search-as-you-type, matched by prefix or trigram similarity.
+        """
+        serializer = ProductSuggestQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        query = serializer.validated_data['q']
+
+        # Both conditions are served by the trigram index on name, \m matches the start of a word
+        queryset = (Products.objects
+                    .filter(Q(name__trigram_similar=query) | Q(name__iregex=r'\m' + re.escape(query)))
+                    .annotate(similarity=TrigramSimilarity('name', query))
+                    .order_by('-similarity', 'id')
+                    .only('id', 'name')[:serializer.validated_data['limit']])
+
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    @action(detail=True, methods=['POST'], serializer_class=Serializer)
+    def restore(self, request, *args, **kwargs):
+        instance = self.get_object()
+        instance.restore()
+        return Response(ProductSerializer(instance, context=self.get_serializer_context()).data)
+
+    def get_neighbours(self, pk, kind):
+        neighbours = (ProductNeighbour.objects
+                      .filter(product_id=pk, kind=kind, neighbour__deleted_at__isnull=True)
+                      .select_related('neighbour').prefetch_related('neighbour__attachments'))
+        return Response(self.get_serializer(neighbours, many=True).data)
+
+    @action(detail=True, methods=['GET'], url_path='bought-together', serializer_class=ProductNeighbourSerializer,
+            pagination_class=None)
+    @cache_response
+    def bought_together(self, request, pk, *args, **kwargs):
+        """
+        Products often bought with this one, precomputed by the `build_bought_together` command.
+        """
+        return self.get_neighbours(pk, ProductNeighbour.Kind.BOUGHT_TOGETHER)
+
+    @action(detail=True, methods=['GET'], serializer_class=ProductNeighbourSerializer, pagination_class=None)
+    @cache_response
+    def similar(self, request, pk, *args, **kwargs):
+        """
+        Products with the most similar name, specs and details, precomputed by the `build_similar_products` command.
+        """
+        return self.get_neighbours(pk, ProductNeighbour.Kind.SIMILAR)
+
+    @action(detail=False, methods=['GET', 'POST'], serializer_class=ProductIdsSerializer,
+            permission_classes=(IsAuthenticated,))
+    def batch(self, request, *args, **kwargs):
+        """
+        The products with the given ids, in the requested order. GET takes `?ids=1,2,3`, POST a JSON `ids` list.
+        """
+        if request.method == 'GET':
+            data = {'ids': [value for value in request.query_params.get('ids', '').split(',') if value]}
+        else:
+            data = request.data
+
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+
+        products = Products.all_objects.filter(id__in=ids).prefetch_related('attachments').in_bulk()
+
+        found = [products[product_id] for product_id in ids if product_id in products]
+        live = [product for product in found if product.deleted_at is None]
+
+        return Response({
+            'results': ProductSerializer(live, many=True, context=self.get_serializer_context()).data,
+            'missing': [product_id for product_id in ids if product_id not in products],
+            'deleted': [product.id for product in found if product.deleted_at is not None],
+        })
 
-class ProductCategoryViewSet(ModelViewSet):
+    @action(detail=False, methods=['POST'], url_path='bulk-delete', serializer_class=ProductIdsSerializer)
+    def bulk_delete(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        count, _ = Products.objects.filter(id__in=serializer.validated_data['ids']).delete()
+        return Response({'deleted': count})
+
+    @action(detail=False, methods=['POST'], url_path='bulk-restore', serializer_class=ProductIdsSerializer)
+    def bulk_restore(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        count = Products.all_objects.filter(id__in=serializer.validated_data['ids'], deleted_at__isnull=False).restore()
+        return Response({'restored': count})
+
+    @action(detail=False, methods=['POST'], url_path='import', serializer_class=ProductImportFileSerializer,
+            parser_classes=(MultiPartParser,), permission_classes=(IsAuthenticated, IsAdmin))
+    def import_products(self, request, *args, **kwargs):
+        """
+        Create or update products from a CSV or JSON lines file, rows with an `id` update that product.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        validated_data = serializer.validated_data
+
+        result = import_products(read_rows(validated_data['file'], validated_data['file_format']))
+        return Response(result)
+
+    @action(detail=False, methods=['GET'], permission_classes=(IsAuthenticated, IsAdmin))
+    def export(self, request, *args, **kwargs):
+        serializer = ProductExportQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        file_format = serializer.validated_data['file_format']
+
+        queryset = self.filter_queryset(self.queryset)
+        content_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+
+        response = StreamingHttpResponse(export_products(queryset, file_format), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
+
+
+class ProductCategoryViewSet(ConditionalListMixin, ConditionalRetrieveMixin, CachedResponseMixin, ModelViewSet):
     serializer_class = ProductCategorySerializer
     queryset = ProductCategory.objects.all()
     permission_classes = (IsAuthenticated, IsAdmin | ReadOnly)
     parser_classes = (MultiPartParser,)
+    cache_models = (ProductCategory,)
+
+    @action(detail=False, methods=['GET'], pagination_class=None)
+    @cache_response
+    def tree(self, request, *args, **kwargs):
+        """
+        The whole category hierarchy, nested under `children`.
+        """
+        categories = self.get_serializer(self.get_queryset().order_by('path'), many=True).data
+
+        nodes = {category['id']: {**category, 'children': []} for category in categories}
+        roots = []
+        for node in nodes.values():
+            parent = nodes.get(node['child_of'])
+            (parent['children'] if parent else roots).append(node)
+
+        return Response(roots)
 
 
 class ProductReviewViewSet(ModelViewSet):
     serializer_class = ProductReviewSerializer
     queryset = ProductReview.objects.all()
     permission_classes = (IsAuthenticated, IsAdminOrOwner | ReadOnly)
+    pagination_class = OptionalCursorPagination
     filterset_fields = ('product', 'rating',)
 
+    def get_queryset(self):
+        qs = self.queryset
+
+        if self.action in ('list', 'retrieve'):
+            qs = self.get_serializer_class().sparse_queryset(qs, self.request)
+
+        return qs
+
+    # The product rating aggregates are updated by signals, keep them in the same transaction
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+
 
 class ProductAttachmentsViewSet(ModelViewSet):
     serializer_class = ProductAttachmentsSerializer
@@ -54,3 +283,30 @@ class ProductAttachmentsViewSet(ModelViewSet):
     permission_classes = (IsAuthenticated, IsAdmin | ReadOnly)
     parser_classes = (MultiPartParser,)
     filterset_fields = ('product',)
+
+
+class UploadSessionViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.RetrieveModelMixin):
+    """
+    Resumable attachment uploads: create a session, PUT the file in byte ranges with a `Content-Range` header
+    and an optional `X-Chunk-Checksum` (SHA-256), then finalize it. `received` tells where to resume.
+    """
+    serializer_class = UploadSessionSerializer
+    queryset = UploadSession.objects.all()
+    permission_classes = (IsAuthenticated, IsAdmin)
+
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def update(self, request, *args, **kwargs):
+        # The body is streamed to disk, never parsed into memory
+        session = write_chunk(self.get_object(), request.stream, request.headers.get('Content-Range'),
+                              request.headers.get('X-Chunk-Checksum'))
+        return Response(self.get_serializer(session).data)
+
+    @action(detail=True, methods=['POST'], serializer_class=Serializer)
+    def finalize(self, request, *args, **kwargs):
+        session = finalize_upload(self.get_object())
+        return Response(UploadSessionSerializer(session).data)
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.22 on 2026-10-18 06:03
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+from apps.common.images import variant_name
+
+
+def fill_image_variants(apps, schema_editor):
+    # Pictures uploaded before the variants were recorded, a last storage lookup each
+    User = apps.get_model('users', 'User')
+    for pk, name in User.objects.exclude(profile_pic='').exclude(profile_pic__isnull=True).values_list(
+            'id', 'profile_pic').iterator():
+        if default_storage.exists(variant_name(name, 'thumbnail')):
+            User.objects.filter(id=pk).update(profile_pic_variants=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='profile_pic_variants',
+            field=models.CharField(default=None, editable=False, max_length=100, null=True),
+        ),
+        migrations.RunPython(fill_image_variants, migrations.RunPython.noop),
+    ]
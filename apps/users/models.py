@@ -27,6 +27,8 @@ class User(BaseModel, AbstractBaseUser):
     first_name = models.CharField(max_length=120, blank=False)
     last_name = models.CharField(max_length=120, blank=False)
     profile_pic = models.ImageField(null=True, blank=True, upload_to="user/profile_pic")
+    # Name of the image its variants were generated for, see ImageVariantsField
+    profile_pic_variants = models.CharField(max_length=100, null=True, default=None, editable=False)
     phone = models.CharField(max_length=20, blank=False, unique=True, validators=[phone_is_valid])
     email = models.EmailField(unique=True)
     birthdate = models.DateField(null=True, default=None)
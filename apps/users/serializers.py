@@ -1,4 +1,6 @@
 from rest_framework import serializers
+
+from apps.common.serializers import ImageVariantsField
 from apps.users.models import User, UserVerification, UserAddress
 
 
@@ -26,6 +28,8 @@ class UserRegisterSerializer(serializers.ModelSerializer):
 
 
 class UserSerializer(serializers.ModelSerializer):
+    profile_pic_variants = ImageVariantsField(source='profile_pic')
+
     class Meta:
         model = User
         fields = [
@@ -35,6 +39,7 @@ class UserSerializer(serializers.ModelSerializer):
             'first_name',
             'last_name',
             'profile_pic',
+            'profile_pic_variants',
             'phone',
             'email',
             'birthdate',
@@ -1,8 +1,9 @@
 from django.core.mail import send_mail
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
 
-from apps.users.models import UserVerification
+from apps.common.images import enqueue_variants
+from apps.users.models import UserVerification, User
 
 
 @receiver(pre_save, sender=UserVerification)
@@ -20,4 +21,9 @@ def send_verification_code_to_user_email(sender, instance, *args, **kwargs):
         from_email=None,
         recipient_list=[instance.user.email],
         fail_silently=True
-    )
\ No newline at end of file
+    )
+
+
+@receiver(post_save, sender=User)
+def create_profile_pic_variants(sender, instance, *args, **kwargs):
+    enqueue_variants(instance.profile_pic)
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_extensions',
     # other
     'drf_yasg',
@@ -107,6 +108,19 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory by default, each process then keeps its own cached responses. They are keyed by the cache
+# generations, which live in the database, so writes from other processes and from management commands
+# (import_products, rebuild_ratings, build_bought_together, build_similar_products) invalidate them everywhere.
+# A shared backend, e.g. CACHE_URL=filecache:///var/tmp/pam, only saves rebuilding the same response per process.
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://')
+}
+
+RESPONSE_CACHE_TIMEOUT = env.int('RESPONSE_CACHE_TIMEOUT', default=60 * 60)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -174,6 +188,18 @@ MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_FOR_TESTING_ROOT = os.path.join(MEDIA_ROOT, 'test')
 
+# Processes resizing uploaded images
+IMAGE_VARIANT_WORKERS = env.int('IMAGE_VARIANT_WORKERS', default=2)
+
+# Term counts of the "similar products" recommendations, rebuilt by build_similar_products
+SIMILAR_PRODUCTS_INDEX = env.str('SIMILAR_PRODUCTS_INDEX', default=os.path.join(BASE_DIR, 'var', 'similar_products.npz'))
+
+# Resumable attachment uploads, in bytes
+UPLOAD_MAX_SIZE = env.int('UPLOAD_MAX_SIZE', default=100 * 1024 * 1024)
+UPLOAD_CHUNK_MAX_SIZE = env.int('UPLOAD_CHUNK_MAX_SIZE', default=8 * 1024 * 1024)
+# Open uploads without a new chunk for this long are removed by expire_uploads
+UPLOAD_SESSION_MAX_AGE_HOURS = env.int('UPLOAD_SESSION_MAX_AGE_HOURS', default=24)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -183,6 +209,21 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 STRIPE_SECRET_TEST_API_KEY = env('STRIPE_SECRET_TEST_API_KEY')
 STRIPE_ENDPOINT_SECRET = env('STRIPE_ENDPOINT_SECRET')
+# The fake_stripe command serves a local stand-in, e.g. http://127.0.0.1:12111
+STRIPE_API_BASE = env.str('STRIPE_API_BASE', default='https://api.stripe.com')
+# Seconds, a checkout never waits on Stripe, the outbox worker does
+STRIPE_CONNECT_TIMEOUT = env.float('STRIPE_CONNECT_TIMEOUT', default=3.05)
+STRIPE_READ_TIMEOUT = env.float('STRIPE_READ_TIMEOUT', default=20)
+# Retries of failed connections, 409, 429 and 5xx answers, with a jittered exponential backoff
+STRIPE_MAX_NETWORK_RETRIES = env.int('STRIPE_MAX_NETWORK_RETRIES', default=2)
+# Keep-alive connections kept open to Stripe by each process
+STRIPE_POOL_SIZE = env.int('STRIPE_POOL_SIZE', default=10)
+
+# PaymentIntents are created by process_payment_outbox, retried with an exponential backoff in seconds
+PAYMENT_OUTBOX_MAX_ATTEMPTS = env.int('PAYMENT_OUTBOX_MAX_ATTEMPTS', default=8)
+PAYMENT_OUTBOX_MAX_DELAY = env.int('PAYMENT_OUTBOX_MAX_DELAY', default=300)
+# Seconds a worker holds an entry while it calls Stripe, longer than the timeouts times the retries
+PAYMENT_OUTBOX_LEASE = env.int('PAYMENT_OUTBOX_LEASE', default=120)
 
 
 # SMTP